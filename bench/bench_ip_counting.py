@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import argparse
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import aggregate_ips  # noqa: E402
+from fetching import read_lines as read_source  # noqa: E402
+
+# Compares the aggregate_ips.py counting engines on a synthetic input.
+# Each engine runs in a fresh process so its peak RSS is its own. "parallel"
+# is the packed engine with count_parallel() over --workers processes; its
+# peak RSS is the parent's only.
+
+PARALLEL = "parallel"
+
+
+def synthetic_feed(lines, seed, hot_24s=20_000, hot_share=0.6):
+    # Realistic-ish clustering: most hits land in a set of hostile /24s,
+    # the rest are spread over the whole address space.
+    rng = random.Random(seed)
+    hot = [rng.getrandbits(24) for _ in range(hot_24s)]
+    for _ in range(lines):
+        if rng.random() < hot_share:
+            net = rng.choice(hot)
+            ip = (net << 8) | rng.getrandbits(8)
+        else:
+            ip = rng.getrandbits(32)
+        yield f"{ip >> 24}.{(ip >> 16) & 255}.{(ip >> 8) & 255}.{ip & 255}"
+
+
+def write_sources(directory, lines, sources, seed):
+    paths = []
+    per_source = lines // sources
+    for i in range(sources):
+        path = Path(directory) / f"source_{i:03}.txt"
+        path.write_text("\n".join(synthetic_feed(per_source, seed + i)) + "\n")
+        paths.append(path)
+    return paths
+
+
+def read_lines(path):
+    with path.open() as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+
+def run_engine(engine, paths, threshold, max_lines, workers):
+    start = time.perf_counter()
+    profiles = [(threshold, max_lines, "prefix")]
+    if engine == PARALLEL:
+        sources = [{"url": path} for path in paths]
+        counter = aggregate_ips.count_parallel(sources, read_source, workers)
+        [lines] = aggregate_ips.render_packed(counter, profiles)
+    else:
+        [lines] = aggregate_ips.ENGINES[engine]((read_lines(p) for p in paths), profiles)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return elapsed, peak_mb, lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the aggregate_ips.py counting engines")
+    parser.add_argument("--lines", type=int, default=5_000_000)
+    parser.add_argument("--sources", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--threshold", type=int, default=aggregate_ips.PROMOTE_THRESHOLD)
+    parser.add_argument("--max-lines", type=int, default=aggregate_ips.MAX_LINES)
+    parser.add_argument("--engines", nargs="+", default=list(aggregate_ips.ENGINES) + [PARALLEL],
+                        choices=list(aggregate_ips.ENGINES) + [PARALLEL])
+    parser.add_argument("--workers", type=int, default=aggregate_ips.WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_sources(tmp, args.lines, args.sources, args.seed)
+        print(f"{args.lines:,} lines in {args.sources} sources, {args.workers} workers")
+
+        results = {}
+        for engine in args.engines:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                results[engine] = pool.submit(
+                    run_engine, engine, paths, args.threshold, args.max_lines, args.workers
+                ).result()
+
+    baseline = results[args.engines[0]]
+    for engine, (elapsed, peak_mb, lines) in results.items():
+        same = "identical" if lines == baseline[2] else "DIFFERENT"
+        speedup = baseline[0] / elapsed
+        print(
+            f"{engine:>8}: {elapsed:7.2f}s  peak RSS {peak_mb:8.1f} MB  "
+            f"{speedup:5.1f}x  {len(lines)} lines ({same})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from fetching import read_lines  # noqa: E402
+from lookup import INDEX_FILE, LookupIndex, list_files  # noqa: E402
+
+# Lookup throughput over the lists in the working tree (run from the repo
+# root): index build and load, single lookup_ip() latency, batched
+# lookup_ips(), and annotate() over a synthetic access log. "scan" is the
+# flat-file baseline. It rereads every list once per batch and only checks
+# exact host matches, so it is a lower bound on the cost of a linear rescan.
+
+
+def queries(index, count, seed):
+    # Half the queries land inside listed ranges, half anywhere.
+    rng = random.Random(seed)
+    bounds = index.v4_bounds
+    out = []
+    for _ in range(count):
+        if rng.random() < 0.5 and len(bounds) > 1:
+            i = rng.randrange(len(bounds) - 1)
+            ip = rng.randrange(int(bounds[i]), int(bounds[i + 1]))
+        else:
+            ip = rng.getrandbits(32)
+        out.append(f"{ip >> 24}.{(ip >> 16) & 255}.{(ip >> 8) & 255}.{ip & 255}")
+    return out
+
+
+def access_log(ips, seed):
+    rng = random.Random(seed)
+    paths = ["/", "/login", "/wp-admin/", "/api/v1/items", "/static/app.js"]
+    return [
+        f'{ip} - - [18/Oct/2026:10:{i % 60:02}:00 +0000] "GET {rng.choice(paths)} HTTP/1.1" 200 512\n'
+        for i, ip in enumerate(ips)
+    ]
+
+
+def scan(ips):
+    wanted = set(ips)
+    hits = 0
+    for _, _, path in list_files():
+        hits += sum(1 for line in read_lines(path) if line in wanted)
+    return hits
+
+
+def timed(label, count, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count:>10,} {elapsed:8.3f}s  {elapsed / count * 1e6:9.3f} us/query  "
+          f"{count / elapsed:>12,.0f} /s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lookup.py")
+    parser.add_argument("--index", type=Path, default=INDEX_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="time a build first")
+    parser.add_argument("--single", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=1_000_000)
+    parser.add_argument("--log-lines", type=int, default=1_000_000)
+    parser.add_argument("--scan", type=int, default=100_000, help="batch size for the scan baseline")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.rebuild or not args.index.exists():
+        start = time.perf_counter()
+        LookupIndex.build().save(args.index)
+        print(f"build: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    index = LookupIndex.load(args.index)
+    print(f"load: {time.perf_counter() - start:.2f}s")
+
+    ips = queries(index, max(args.single, args.batch, args.log_lines, args.scan), args.seed)
+
+    single = ips[:args.single]
+    timed("lookup_ip", len(single), lambda: [index.lookup_ip(ip) for ip in single])
+    batch = ips[:args.batch]
+    matches = timed("lookup_ips", len(batch), lambda: index.lookup_ips(batch))
+    print(f"  {sum(map(bool, matches)) / len(matches):.1%} of queries listed")
+
+    log = access_log(ips[:args.log_lines], args.seed)
+    timed("annotate", len(log), lambda: io.StringIO().writelines(index.annotate(iter(log))))
+
+    timed("scan (exact hosts only)", args.scan, lambda: scan(ips[:args.scan]))
+
+
+if __name__ == "__main__":
+    main()
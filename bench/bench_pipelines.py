@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import aggregate_feeds  # noqa: E402
+import aggregate_ips  # noqa: E402
+import filter as filter_script  # noqa: E402
+from bench_ip_counting import synthetic_feed  # noqa: E402
+from domain_filter import MODES  # noqa: E402
+from fetching import FetchState, fetch_source, read_lines  # noqa: E402
+from ipcount import PackedCounter, Rollup  # noqa: E402
+from manifest import Manifest  # noqa: E402
+from snapshot_store import SnapshotStore  # noqa: E402
+from window_index import WindowIndex  # noqa: E402
+
+# Stage timings for the three pipelines on deterministic synthetic inputs,
+# with no network access:
+#   feeds   aggregate_feeds.py: fetch (stubbed session), parse, snapshot,
+#           window build and write, replayed over a --days history per feed
+#   ips     aggregate_ips.py: count, rollup, sort (every profile) and write
+#           over IP feeds and CIDR netsets
+#   filter  filter.py's own stages over Tranco-sized domain inputs
+#
+# Each pipeline runs in a fresh process, so its peak RSS is its own; a
+# stage's figure is the process peak when the stage ended. Every pipeline
+# also hashes its outputs. --save writes the results as JSON; running
+# another commit with --compare against that file flags stages that got
+# slower than --tolerance and outputs that changed. Timings on a shared
+# machine are noisy; --repeat keeps each stage's fastest run.
+
+START_DAY = date(2025, 1, 1)
+
+# Options that do not change the generated inputs.
+RUN_OPTIONS = {"pipelines", "save", "compare", "tolerance", "repeat"}
+
+
+def netset(lines, seed):
+    # CIDRs weighted towards the small prefixes real netsets are made of.
+    rng = random.Random(seed)
+    for _ in range(lines):
+        prefix = rng.choice((16, 19, 20, 22, 23, 24, 24, 24, 25, 28, 30, 32))
+        network = rng.getrandbits(32) & ~((1 << (32 - prefix)) - 1)
+        octets = ".".join(str((network >> shift) & 255) for shift in (24, 16, 8, 0))
+        yield octets if prefix == 32 else f"{octets}/{prefix}"
+
+
+def history(size, days, churn, seed):
+    # (day, indicators) for `days` days; each day a `churn` share of the
+    # previous day's indicators is replaced by fresh ones.
+    rng = random.Random(seed)
+    fresh = synthetic_feed(size + int(size * churn) * days, seed)
+    current = {next(fresh) for _ in range(size)}
+    for i in range(days):
+        if i:
+            dropped = set(rng.sample(sorted(current), int(len(current) * churn)))
+            current = (current - dropped) | {next(fresh) for _ in range(len(dropped))}
+        yield START_DAY + timedelta(days=i), current
+
+
+def domains(count, seed, tld_count=50):
+    rng = random.Random(seed)
+    tlds = [f"t{rng.getrandbits(20):x}" for _ in range(tld_count)] + ["com"] * tld_count
+    for _ in range(count):
+        labels = [f"{rng.getrandbits(32):x}" for _ in range(rng.choice((1, 1, 2, 3)))]
+        yield ".".join(labels + [rng.choice(tlds)])
+
+
+def tranco(count, seed, overlap):
+    # Rank,domain rows; `overlap` of the rows are taken from the block list
+    # generator so the subtraction has something to remove.
+    blocked = domains(count, seed)
+    popular = domains(count, seed + 1_000_000)
+    rng = random.Random(seed)
+    for rank in range(1, count + 1):
+        yield f"{rank},{next(blocked) if rng.random() < overlap else next(popular)}"
+
+
+class Stages:
+    # Accumulated wall time, item count and peak RSS per stage name.
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def __call__(self, name):
+        counts = {"items": 0}
+        start = time.perf_counter()
+        yield counts
+        elapsed = time.perf_counter() - start
+        total = self.stages.setdefault(name, {"seconds": 0.0, "items": 0})
+        total["seconds"] += elapsed
+        total["items"] += counts["items"]
+        total["peak_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StubResponse:
+    status_code = 200
+    encoding = "utf-8"
+
+    def __init__(self, url, body):
+        self.url = url
+        self.body = body
+        self.headers = {}
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class StubSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def get(self, url, **kwargs):
+        return StubResponse(url, self.bodies[url])
+
+
+class StubPool:
+    # Stands in for fetching.SessionPool.
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url):
+        return self.session
+
+
+def bench_feeds(args, tmp, stages):
+    digest = hashlib.sha256()
+    windows = aggregate_feeds.WINDOWS
+    state = FetchState(tmp / "fetch_state.json")
+    manifest = Manifest(tmp / "manifest.json")
+
+    for feed in range(args.feeds):
+        name = f"feed_{feed:02}"
+        url = f"https://example.invalid/{name}.ipset"
+        raw_dir = tmp / name / "raw"
+        raw_dir.mkdir(parents=True)
+        store = SnapshotStore(raw_dir, aggregate_feeds.SNAPSHOT_FORMAT,
+                              aggregate_feeds.CHECKPOINT_DAYS)
+        index = WindowIndex()
+
+        size = int(args.feed_size * args.scale)
+        for day, indicators in history(size, args.days, args.churn, args.seed + feed):
+            with stages("fetch stub") as counts:
+                body = ("\n".join(sorted(indicators)) + "\n").encode()
+                pool = StubPool(StubSession({url: body}))
+                # parse() is timed on its own below.
+                result = fetch_source(name, url, lambda response: response, pool,
+                                      state=state, snapshot=str(day))
+                if not result.ok:
+                    raise RuntimeError(result.error)
+                counts["items"] += len(body)
+            with stages("parse") as counts:
+                ips = aggregate_feeds.parse_ips(result.data)
+                counts["items"] += len(ips)
+            with stages("snapshot") as counts:
+                store.write(day, ips)
+                index.add_snapshot(day, ips)
+                index.expire(day, max(windows.values()))
+                index.forget_days(store.prune(aggregate_feeds.MAX_RAW_DAYS))
+                counts["items"] += 1
+            with stages("window build") as counts:
+                built = index.windows(day, windows)
+                counts["items"] += sum(map(len, built.values()))
+            with stages("write") as counts:
+                for label, lines in built.items():
+                    text = "\n".join(lines) + "\n"
+                    counts["items"] += manifest.write_text(tmp / name / f"{label}.txt", text)
+                index.save(tmp / name / "index.tsv")
+
+        for label in windows:
+            digest.update((tmp / name / f"{label}.txt").read_bytes())
+    return digest.hexdigest()
+
+
+def bench_ips(args, tmp, stages):
+    lines = int(args.ip_lines * args.scale)
+    per_source = lines // args.ip_sources
+    paths = []
+    for i in range(args.ip_sources):
+        path = tmp / f"source_{i:03}.txt"
+        path.write_text("\n".join(synthetic_feed(per_source, args.seed + i)) + "\n")
+        paths.append(path)
+    for i in range(args.netsets):
+        path = tmp / f"netset_{i:02}.netset"
+        path.write_text("\n".join(netset(int(args.netset_size * args.scale), args.seed + i)) + "\n")
+        paths.append(path)
+
+    counter = PackedCounter()
+    with stages("count") as counts:
+        for path in paths:
+            counter.add_lines(read_lines(path))
+        counts["items"] = len(counter)
+    with stages("rollup") as counts:
+        rollup = Rollup(counter)
+        counts["items"] = len(rollup.net24)
+    with stages("sort") as counts:
+        profiles = [(threshold, max_lines, mode)
+                    for threshold, max_lines, _, mode in aggregate_ips.PROFILES]
+        results = aggregate_ips.render_rollup(rollup, profiles)
+        counts["items"] = sum(map(len, results))
+
+    digest = hashlib.sha256()
+    with stages("write") as counts:
+        for i, result in enumerate(results):
+            text = "\n".join(result) + "\n" if result else ""
+            (tmp / f"output_{i}.txt").write_text(text)
+            digest.update(text.encode())
+            counts["items"] += len(result)
+    return digest.hexdigest()
+
+
+def bench_filter(args, tmp, stages):
+    count = int(args.domains * args.scale)
+    lists = []
+    for i in range(3):
+        path = tmp / f"hagezi_{i}.txt"
+        path.write_text("\n".join(domains(count, args.seed + i)) + "\n")
+        lists.append(str(path))
+    csv = tmp / "tranco.csv"
+    csv.write_text("\n".join(tranco(int(args.tranco * args.scale), args.seed, 0.05)) + "\n")
+    output = tmp / "filtered.txt"
+
+    report = filter_script.main(
+        lists + [str(csv), str(output), "--mode", args.mode, "--report", str(tmp / "report.json")]
+    )
+    for stage in report.stages:
+        stages.stages[stage["stage"]] = {
+            "seconds": stage["seconds"], "items": stage["domains"], "peak_mb": stage["peak_rss_mb"],
+        }
+    return hashlib.sha256(output.read_bytes()).hexdigest()
+
+
+PIPELINES = {"feeds": bench_feeds, "ips": bench_ips, "filter": bench_filter}
+
+
+def run_pipeline(name, args):
+    stages = Stages()
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        digest = PIPELINES[name](args, Path(tmp), stages)
+        elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"seconds": elapsed, "peak_mb": peak_mb, "digest": digest, "stages": stages.stages}
+
+
+def best(a, b):
+    # Fastest time per stage across repeated runs.
+    for stage, figures in b["stages"].items():
+        if stage in a["stages"]:
+            figures["seconds"] = min(figures["seconds"], a["stages"][stage]["seconds"])
+    b["seconds"] = min(a["seconds"], b["seconds"])
+    return b
+
+
+def compare(results, baseline, tolerance, args):
+    # Prints the changes against a saved run; True if anything regressed.
+    inputs = {k: v for k, v in vars(args).items() if k not in RUN_OPTIONS}
+    changed = [k for k, v in inputs.items() if str(baseline["args"].get(k)) != str(v)]
+    if changed:
+        print(f"Inputs differ from the saved run ({', '.join(changed)}); digests will too")
+    regressed = False
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if result["digest"] != base["digest"]:
+            print(f"{name}: outputs DIFFER from {baseline['commit'][:10]}")
+            regressed = True
+        for stage, figures in result["stages"].items():
+            old = base["stages"].get(stage)
+            if old is None or old["seconds"] < 0.01:
+                continue
+            ratio = figures["seconds"] / old["seconds"]
+            flag = "  SLOWER" if ratio > tolerance else ""
+            regressed |= bool(flag)
+            print(f"{name:>7} {stage:<16} {old['seconds']:8.2f}s -> {figures['seconds']:8.2f}s "
+                  f"{ratio:5.2f}x  peak {old['peak_mb']:7.1f} -> {figures['peak_mb']:7.1f} MB{flag}")
+    return regressed
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the feed, IP and domain pipelines")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=list(PIPELINES))
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every input size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--feeds", type=int, default=4)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--feed-size", type=int, default=20_000)
+    parser.add_argument("--churn", type=float, default=0.1, help="share replaced per day")
+    parser.add_argument("--ip-lines", type=int, default=2_000_000)
+    parser.add_argument("--ip-sources", type=int, default=30)
+    parser.add_argument("--netsets", type=int, default=3)
+    parser.add_argument("--netset-size", type=int, default=20_000)
+    parser.add_argument("--domains", type=int, default=300_000, help="per block list")
+    parser.add_argument("--tranco", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=MODES, default="exact", help="filter.py --mode")
+    parser.add_argument("--save", type=Path, help="write the results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--repeat", type=int, default=1, help="keep the fastest of N runs")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.pipelines:
+        for _ in range(args.repeat):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_pipeline, name, args).result()
+            results[name] = best(results[name], result) if name in results else result
+
+    for name, result in results.items():
+        print(f"{name}: {result['seconds']:.2f}s  peak RSS {result['peak_mb']:.1f} MB  "
+              f"digest {result['digest'][:12]}")
+        for stage, figures in result["stages"].items():
+            print(f"  {stage:<18} {figures['items']:>12,} {figures['seconds']:8.2f}s  "
+                  f"peak RSS {figures['peak_mb']:8.1f} MB")
+
+    run = {"commit": current_commit(), "args": vars(args), "results": results}
+    if args.save:
+        args.save.write_text(json.dumps(run, indent=2, default=str) + "\n")
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if compare(results, baseline, args.tolerance, args):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import argparse
+import gzip
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_ip_counting import synthetic_feed  # noqa: E402
+from fetching import iter_lines  # noqa: E402
+from ipcount import PackedCounter  # noqa: E402
+
+# Peak Python heap per feed for the old response.text.splitlines() ingest and
+# the streaming iter_lines() ingest, served from a local HTTP server. The
+# parsed addresses go into a PackedCounter so only the ingest path differs.
+
+
+def ingest_text(url):
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    counter = PackedCounter()
+    counter.add_lines(
+        line.strip()
+        for line in response.text.splitlines()
+        if line.strip() and not line.startswith("#")
+    )
+    return len(counter)
+
+
+def ingest_stream(url):
+    with requests.get(url, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        counter = PackedCounter()
+        counter.add_lines(iter_lines(response))
+        return len(counter)
+
+
+INGESTS = {"text": ingest_text, "stream": ingest_stream}
+
+
+def measure(ingest, url):
+    tracemalloc.start()
+    start = time.perf_counter()
+    entries = ingest(url)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return entries, elapsed, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feed ingest memory")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--port", type=int, default=8764)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            body = ("\n".join(synthetic_feed(size, size)) + "\n").encode()
+            (Path(tmp) / f"feed_{size}.txt").write_bytes(body)
+            (Path(tmp) / f"feed_{size}.txt.gz").write_bytes(gzip.compress(body))
+
+        server = subprocess.Popen(
+            [sys.executable, "-m", "http.server", str(args.port), "--bind", "127.0.0.1",
+             "--directory", tmp],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            time.sleep(1)
+            print(f"{'feed':>22} {'ingest':>7} {'entries':>10} {'time':>8} {'peak heap':>10}")
+            for size in args.sizes:
+                for suffix in (".txt", ".txt.gz"):
+                    name = f"feed_{size}{suffix}"
+                    url = f"http://127.0.0.1:{args.port}/{name}"
+                    for label, ingest in INGESTS.items():
+                        if suffix.endswith(".gz") and label == "text":
+                            continue
+                        entries, elapsed, peak = measure(ingest, url)
+                        print(f"{name:>22} {label:>7} {entries:>10,} {elapsed:7.2f}s {peak:8.1f} MB")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
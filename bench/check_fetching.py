@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from fetching import FetchState, fetch_all, iter_lines  # noqa: E402
+
+# Checks the shared fetch stage (scripts/fetching.py) against a scripted
+# local server: conditional GETs and 304s, retries with backoff and
+# Retry-After, no retry on a 404, timeouts, and one failing feed leaving the
+# others alone. Every path serves a small IP list:
+#
+#   /static      ETag and Last-Modified; 304 when either validator matches
+#   /rehashed    no validators, same body every time (unchanged by sha256)
+#   /flaky       503 with Retry-After: 0 on the first FLAKY_FAILURES requests
+#   /down        always 500
+#   /missing     always 404
+#   /slow        answers after SLOW_SECONDS, well past the check's timeout
+#   /garbage     a body parse() rejects
+
+FLAKY_FAILURES = 2
+SLOW_SECONDS = 1.0
+TIMEOUT = 0.3
+RETRIES = 2
+BACKOFF = 0.01
+
+BODY = b"192.0.2.1\n192.0.2.2\n198.51.100.7\n"
+ETAG = '"v1"'
+LAST_MODIFIED = formatdate(1_700_000_000, usegmt=True)
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    hits = Counter()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, status=200, headers=()):
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except ConnectionError:
+            pass  # the client gave up on /slow
+
+    def do_GET(self):
+        with self.lock:
+            self.hits[self.path] += 1
+            hits = self.hits[self.path]
+
+        if self.path == "/static":
+            if (self.headers.get("If-None-Match") == ETAG
+                    or self.headers.get("If-Modified-Since") == LAST_MODIFIED):
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_body(BODY, headers=[("ETag", ETAG), ("Last-Modified", LAST_MODIFIED)])
+        elif self.path == "/rehashed":
+            self.send_body(BODY)
+        elif self.path == "/flaky":
+            if hits <= FLAKY_FAILURES:
+                self.send_body(b"busy\n", 503, [("Retry-After", "0")])
+            else:
+                self.send_body(BODY)
+        elif self.path == "/down":
+            self.send_body(b"error\n", 500)
+        elif self.path == "/slow":
+            time.sleep(SLOW_SECONDS)
+            self.send_body(BODY)
+        elif self.path == "/garbage":
+            self.send_body(b"not an address\n")
+        else:
+            self.send_body(b"not found\n", 404)
+
+
+def parse(response):
+    lines = set(iter_lines(response))
+    if "not an address" in lines:
+        raise ValueError("not an IP list")
+    return lines
+
+
+def check(label, ok, detail=""):
+    print(f"{'ok' if ok else 'FAIL':>4}  {label}{f'  ({detail})' if detail and not ok else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check feed fetching against a local server")
+    parser.add_argument("--port", type=int, default=0, help="default: any free port")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    names = ["static", "rehashed", "flaky", "down", "missing", "slow", "garbage"]
+    sources = [(name, f"{base}/{name}") for name in names]
+    expected = set(BODY.decode().split())
+
+    def run(state):
+        return fetch_all(sources, parse, state=state, snapshot="day1",
+                         timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF)
+
+    passed = True
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            state = FetchState(Path(tmp) / "fetch_state.json")
+
+            print("== first run")
+            results = run(state)
+            passed &= check("served feeds parse", all(
+                results[name].ok and results[name].data == expected
+                for name in ("static", "rehashed", "flaky")
+            ))
+            passed &= check("503 retried until it succeeds",
+                            results["flaky"].attempts == FLAKY_FAILURES + 1,
+                            f"{results['flaky'].attempts} attempts")
+            passed &= check("500 retried, then reported failed",
+                            not results["down"].ok and results["down"].attempts == RETRIES + 1)
+            passed &= check("404 reported failed without a retry",
+                            not results["missing"].ok and results["missing"].attempts == 1)
+            passed &= check("timeout retried, then reported failed",
+                            not results["slow"].ok and results["slow"].attempts == RETRIES + 1,
+                            results["slow"].error)
+            passed &= check("parse error reported failed without a retry",
+                            not results["garbage"].ok and results["garbage"].attempts == 1)
+            state.save()
+
+            print("== second run, validators from the first")
+            results = run(FetchState(state.path))
+            static = results["static"]
+            passed &= check("conditional GET answered 304",
+                            static.status == 304 and static.not_modified
+                            and static.snapshot == "day1" and static.data is None)
+            rehashed = results["rehashed"]
+            passed &= check("identical body reported unchanged, parsed result dropped",
+                            rehashed.status == 200 and rehashed.unchanged
+                            and rehashed.snapshot == "day1" and rehashed.data is None)
+            passed &= check("failed feeds stay isolated",
+                            not results["down"].ok and results["static"].ok)
+
+            print("== without state")
+            results = fetch_all(sources[:2], parse, timeout=TIMEOUT, retries=RETRIES,
+                                backoff=BACKOFF)
+            passed &= check("plain fetch parses every time", all(
+                result.ok and result.data == expected and not result.not_modified
+                for result in results.values()
+            ))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if not passed:
+        sys.exit("fetch checks failed")
+
+
+if __name__ == "__main__":
+    main()
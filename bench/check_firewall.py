@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+from aggregate_ips import PROFILES  # noqa: E402
+from firewall import compile_list, line_network  # noqa: E402
+from manifest import digest  # noqa: E402
+
+# Checks that aggregate_ips.py can compile its firewall files against the
+# output lists as they are committed, i.e. with each list as the "previous"
+# file of the next run. Run from the repository root. Nothing is written.
+#
+# For every profile output that exists, the list is compiled twice against
+# its own committed content: once with the lines that still parse (the diff
+# must be empty) and once with no lines at all (the diff removes exactly
+# those). Lines that do not parse are reported, not fatal.
+
+
+def check(label, ok, detail=""):
+    print(f"{'ok' if ok else 'FAIL':>4}  {label}{f'  ({detail})' if detail and not ok else ''}")
+    return ok
+
+
+def parses(line, v6):
+    try:
+        return line_network(line).version == (6 if v6 else 4)
+    except ValueError:
+        return False
+
+
+def diff_counts(compiled):
+    # (+added, -removed) from the plain diff's header line.
+    header = next(data for path, data in compiled.items() if path.name.endswith(".diff"))
+    counts = header.decode().split("\n", 1)[0].split()
+    return int(counts[2]), -int(counts[3])
+
+
+def main():
+    passed = True
+    checked = 0
+    for _, _, output_file, mode in PROFILES:
+        if not output_file.exists():
+            continue
+        checked += 1
+        v6 = mode == "v6"
+        previous = output_file.read_text()
+        lines = [line for line in previous.split() if parses(line, v6)]
+        skipped = len(previous.split()) - len(lines)
+        print(f"== {output_file}: {len(lines):,} lines, {skipped:,} left out of the diff")
+        try:
+            same = compile_list(output_file, lines, previous.split(), digest(previous),
+                                digest(previous), v6=v6)
+            empty = compile_list(output_file, [], previous.split(), digest(previous),
+                                 digest(""), v6=v6)
+        except Exception as e:
+            passed &= check("compiles against the committed list", False, f"{type(e).__name__}: {e}")
+            continue
+        passed &= check("compiles against the committed list", True)
+        passed &= check("unchanged list diffs empty", diff_counts(same) == (0, 0),
+                        str(diff_counts(same)))
+        passed &= check("emptied list removes every parsed line",
+                        diff_counts(empty) == (0, len(lines)), str(diff_counts(empty)))
+
+    passed &= check("at least one committed output checked", checked > 0)
+    if not passed:
+        sys.exit("firewall checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
+
+import aggregate_feeds  # noqa: E402
+from fetching import FetchResult  # noqa: E402
+from history import HISTORY_NAME, History  # noqa: E402
+from manifest import Manifest  # noqa: E402
+from run_report import RunReport  # noqa: E402
+from snapshot_store import SnapshotStore  # noqa: E402
+
+# Checks that aggregated/<feed>/history.npz holds exactly the snapshots in
+# raw/ for a feed with gaps. The feed is run through aggregate_feeds.py's
+# update_feed() day by day, skipping days at random the way a failed or
+# missed fetch would. Pruning counts stored days, and journal mode keeps a
+# few more until the oldest is a full snapshot, so the stored days stretch
+# well past MAX_RAW_DAYS calendar days. Unchanged days are handed over like
+# a 304, exercising the repeat path as well.
+
+DAYS = 400
+FETCH_RATE = 0.6
+CHANGE_RATE = 0.5
+POOL = 400
+LISTED = 60
+
+
+def check(label, ok, detail=""):
+    print(f"{'ok' if ok else 'FAIL':>4}  {label}{f'  ({detail})' if detail and not ok else ''}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the sighting history of a feed with gaps")
+    parser.add_argument("--days", type=int, default=DAYS, help="calendar days to simulate")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    source = {"name": "gappy", "url": "https://example.invalid/gappy.txt"}
+    start = date(2026, 1, 1)
+    listed = None
+    mismatches = []
+    widest = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        aggregate_feeds.BASE_DIR = Path(tmp)
+        manifest = Manifest(Path(tmp) / "manifest.json")
+        store = SnapshotStore(Path(tmp) / source["name"] / "raw", aggregate_feeds.SNAPSHOT_FORMAT,
+                              aggregate_feeds.CHECKPOINT_DAYS)
+        for offset in range(args.days):
+            day = start + timedelta(days=offset)
+            if listed is not None and rng.random() > FETCH_RATE:
+                continue
+            aggregate_feeds.TODAY = day
+            if listed is None or rng.random() < CHANGE_RATE:
+                listed = {f"198.51.{n >> 8}.{n & 255}" for n in rng.sample(range(POOL), LISTED)}
+                result = FetchResult(source["name"], source["url"], data=listed)
+            else:
+                newest = store.days()[-1]
+                result = FetchResult(source["name"], source["url"], not_modified=True,
+                                     snapshot=str(newest))
+            with contextlib.redirect_stdout(io.StringIO()):
+                aggregate_feeds.update_feed(source, result, manifest, RunReport("check_history"))
+
+            raw_days = store.days()
+            widest = max(widest, (raw_days[-1] - raw_days[0]).days + 1)
+            history = History.load(Path(tmp) / source["name"] / HISTORY_NAME)
+            days, present = history.matrix()
+            stored = [date.fromordinal(int(d)) for d in days]
+            expected = dict(store.replay())
+            if stored != raw_days or any(
+                {history.indicators[i] for i in present[:, column].nonzero()[0]}
+                != expected[stored_day]
+                for column, stored_day in enumerate(stored)
+            ):
+                mismatches.append(day)
+
+    passed = check(f"stored days spread over more than {aggregate_feeds.MAX_RAW_DAYS} days",
+                   widest > aggregate_feeds.MAX_RAW_DAYS, f"at most {widest}")
+    passed &= check("history matches raw/ after every run", not mismatches,
+                    f"first mismatch on {mismatches[0]}" if mismatches else "")
+    if not passed:
+        sys.exit("history checks failed")
+
+
+if __name__ == "__main__":
+    main()
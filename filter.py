@@ -1,37 +1,76 @@
+import argparse
 import sys
-import csv
-
-tif = sys.argv[1]
-nrd7 = sys.argv[2]
-dga30 = sys.argv[3]
-tranco_csv = sys.argv[4]
-output = sys.argv[5]
-
-# Load Majestic Million
-tranco = set()
-with open(tranco_csv, newline="") as f:
-    reader = csv.reader(f)
-    next(reader)  # skip header
-    for row in reader:
-        domain = row[1].strip().lower()
-        tranco.add(domain)
-
-# Load and combine Hagezi lists
-combined = set()
-
-for path in [tif, nrd7, dga30]:
-    with open(path) as f:
-        for line in f:
-            d = line.strip().lower()
-            if d:
-                combined.add(d)
-
-# Subtract Majestic Million
-filtered = [d for d in combined if d not in tranco]
-
-# Write output
-with open(output, "w") as f:
-    f.write("\n".join(sorted(filtered)))
-
-print("Combined domains:", len(combined))
-print("After removing Tranco:", len(filtered))
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+from domain_filter import (  # noqa: E402
+    MODES, DomainIndex, from_keys, read_domain_keys, read_tranco_keys, subtract,
+)
+from domain_index import CACHE_DIR, MappedDomainIndex  # noqa: E402
+from exclusions import Exclusions  # noqa: E402
+from run_report import RunReport  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Combine Hagezi lists and subtract Tranco")
+    parser.add_argument("tif")
+    parser.add_argument("nrd7")
+    parser.add_argument("dga30")
+    parser.add_argument("tranco_csv")
+    parser.add_argument("output")
+    parser.add_argument("--mode", choices=MODES, default="exact",
+                        help="how Tranco entries match blocklisted domains (default: exact)")
+    parser.add_argument("--report", help="run report JSON (default: next to the output)")
+    parser.add_argument("--cache", type=Path, nargs="?", const=CACHE_DIR,
+                        help=f"compile Tranco into a mapped index here and reuse it while the "
+                             f"CSV is unchanged (default directory: {CACHE_DIR})")
+    args = parser.parse_args(argv)
+
+    report = RunReport("filter")
+
+    # Load and combine Hagezi lists
+    combined = set()
+    for path in [args.tif, args.nrd7, args.dga30]:
+        size = len(combined)
+        combined.update(read_domain_keys(path))
+        report.source(path, added=len(combined) - size)
+    total = len(combined)
+    report.stage("load hagezi", domains=total)
+
+    # Subtract Tranco
+    if args.cache:
+        tranco = MappedDomainIndex.open(args.tranco_csv, read_tranco_keys, args.cache)
+        report.source(args.tranco_csv, cached=tranco.cached, index=str(tranco.path))
+        report.stage("load tranco", domains=len(tranco))
+        kept = tranco.subtract(combined, args.mode)
+    elif args.mode == "exact":
+        # Streamed straight out of the CSV; Tranco is never held.
+        combined.difference_update(read_tranco_keys(args.tranco_csv))
+        kept = combined
+    else:
+        tranco = DomainIndex.from_keys(read_tranco_keys(args.tranco_csv))
+        report.stage("load tranco", domains=len(tranco))
+        kept = list(subtract(combined, tranco, args.mode))
+    report.stage(f"subtract ({args.mode})", domains=len(kept))
+
+    # Subtract the allow lists (domainWhitelist)
+    exclusions = Exclusions.load(ip_allow=(), ip_deny=())
+    kept = exclusions.domain_keys(kept)
+    filtered = sorted(from_keys(kept))
+    report.stage("subtract allow lists", domains=len(filtered))
+
+    # Write output
+    with open(args.output, "w") as f:
+        f.write("\n".join(filtered))
+    report.stage("write", domains=len(filtered))
+
+    print("Combined domains:", total)
+    print("After removing Tranco and allow lists:", len(filtered))
+    report.print()
+    report.write(args.report or Path(args.output).with_suffix(".report.json"))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 
-import requests
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import date, datetime
+
+from fetching import FetchResult, FetchState, fetch_all, iter_lines
+from history import HISTORY_NAME, History, build_history
+from manifest import Manifest
+from run_report import RunReport
+from snapshot_store import SnapshotStore
+from window_index import INDEX_NAME, WindowIndex
 
 BASE_DIR = Path("aggregated")
+FETCH_STATE = BASE_DIR / "fetch_state.json"
+MANIFEST = BASE_DIR / "manifest.json"
+REPORT = BASE_DIR / "run_report.json"
 
 SOURCES = [
     {
@@ -139,56 +148,156 @@ WINDOWS = {
 
 TODAY = datetime.utcnow().date()
 
+# --- Limit growth per feed ---
+MAX_RAW_DAYS = 90
 
-def fetch_ips(url):
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    return {
-        line.strip()
-        for line in r.text.splitlines()
-        if line.strip() and not line.startswith("#")
-    }
+# raw/ storage: "text", "packed" or "journal" (packed checkpoints plus daily deltas)
+SNAPSHOT_FORMAT = "journal"
+CHECKPOINT_DAYS = 7
 
 
-def load_ips_from_file(path):
-    return {
-        line.strip()
-        for line in path.read_text().splitlines()
-        if line.strip()
-    }
+def parse_ips(response):
+    return set(iter_lines(response))
+
 
+def build_index(store):
+    # Full rebuild by replaying raw/; only needed when the index is missing
+    # or out of sync with the stored days.
+    print(f"Rebuilding window index from {store.raw_dir}")
+    index = WindowIndex()
+    for day, ips in store.replay():
+        index.add_snapshot(day, ips)
+    return index
 
-for source in SOURCES:
+
+def update_feed(source, result, manifest, report):
     name = source["name"]
-    url = source["url"]
 
     source_dir = BASE_DIR / name
     raw_dir = source_dir / "raw"
     raw_dir.mkdir(parents=True, exist_ok=True)
 
-    today_file = raw_dir / f"{TODAY}.txt"
+    index_file = source_dir / INDEX_NAME
+    store = SnapshotStore(raw_dir, SNAPSHOT_FORMAT, CHECKPOINT_DAYS)
+    index = WindowIndex.load(index_file)
+    history_file = source_dir / HISTORY_NAME
+    history = History.load(history_file)
+    manifest.stage("parse", not result.not_modified)
 
-    # Fetch & store today's snapshot
-    ips_today = fetch_ips(url)
-    today_file.write_text("\n".join(sorted(ips_today)) + "\n")
+    # Store today's snapshot; an unchanged feed repeats its last snapshot.
+    # When that is the newest stored day and the index is in sync, neither
+    # the snapshot nor the index needs the actual indicators.
+    days = store.days()
+    repeat = (
+        result.not_modified
+        and days and str(days[-1]) == result.snapshot and days[-1] < TODAY
+        and index is not None and index.matches(days, days[-1])
+    )
+    manifest.stage("snapshot", not repeat)
+    if repeat:
+        store.repeat(TODAY)
+        index.repeat_newest(TODAY)
+    else:
+        if result.not_modified:
+            ips_today = store.read(date.fromisoformat(result.snapshot))
+        else:
+            ips_today = result.data
+        store.write(TODAY, ips_today)
 
-    # Build aggregates
-    for label, days in WINDOWS.items():
-        cutoff = TODAY - timedelta(days=days - 1)
-        all_ips = set()
+        if index is None or not index.matches(store.days(), TODAY):
+            index = build_index(store)
+        else:
+            index.add_snapshot(TODAY, ips_today)
+    index.expire(TODAY, max(WINDOWS.values()))
 
-        for raw_file in raw_dir.glob("*.txt"):
-            file_date = datetime.strptime(raw_file.stem, "%Y-%m-%d").date()
-            if file_date >= cutoff:
-                all_ips |= load_ips_from_file(raw_file)
+    # The sighting history follows the same rules, but is checked on its own:
+    # it may be missing or stale while the index is in sync.
+    if (
+        history is None or not history.matches(store.days(), TODAY)
+        or (repeat and TODAY.toordinal() in history.stored_days())
+    ):
+        history = build_history(store)
+    elif repeat:
+        history.repeat_newest(TODAY)
+    else:
+        history.add_snapshot(TODAY, ips_today)
 
+    # Build aggregates; files whose content did not change are left alone
+    windows = index.windows(TODAY, WINDOWS)
+    for label, ips in windows.items():
         out_file = source_dir / f"{label}.txt"
-        out_file.write_text("\n".join(sorted(all_ips)) + "\n")
-
-    # --- Limit growth per feed ---
-    MAX_RAW_DAYS = 90
-    raw_files = sorted(raw_dir.glob("*.txt"))
-    if len(raw_files) > MAX_RAW_DAYS:
-        for old_file in raw_files[:-MAX_RAW_DAYS]:
-            print(f"Removing old raw snapshot: {old_file}")
-            old_file.unlink()
+        manifest.stage("windows", manifest.write_text(out_file, "\n".join(ips) + "\n"))
+
+    pruned = store.prune(MAX_RAW_DAYS)
+    index.forget_days(pruned)
+    history.forget_days(pruned)
+
+    index.save(index_file)
+    history.save(history_file)
+    report.source(
+        name,
+        indicators=None if result.data is None else len(result.data),
+        index_entries=len(index.entries),
+        history_indicators=int(history.bitmap.any(axis=1).sum()),
+        windows={label: len(ips) for label, ips in windows.items()},
+    )
+    return index
+
+
+def main(fetched=None):
+    # fetched: {source name: set of indicators} already fetched in this
+    # process (pipeline.py); those sources are not downloaded again.
+    # Returns {source name: WindowIndex} for every feed that was updated.
+    fetched = fetched or {}
+    report = RunReport("aggregate_feeds")
+    state = FetchState(FETCH_STATE)
+    manifest = Manifest(MANIFEST)
+
+    # Validators are only useful while the snapshot they describe is on disk.
+    for source in SOURCES:
+        snapshot = state.get(source["url"]).get("snapshot")
+        raw_dir = BASE_DIR / source["name"] / "raw"
+        if snapshot and not any(raw_dir.glob(f"{snapshot}.*")):
+            state.drop(source["url"])
+
+    results = fetch_all(
+        ((source["name"], source["url"]) for source in SOURCES if source["name"] not in fetched),
+        parse_ips,
+        state=state,
+        snapshot=str(TODAY),
+    )
+    for source in SOURCES:
+        if source["name"] in fetched:
+            data = fetched[source["name"]]
+            results[source["name"]] = FetchResult(source["name"], source["url"], data=data)
+    for result in results.values():
+        report.fetched(result)
+    report.stage("fetch", sources=len(results),
+                 bytes=sum(result.bytes for result in results.values()))
+
+    failed = []
+    indexes = {}
+    with report.profile("update"):
+        for source in SOURCES:
+            result = results[source["name"]]
+            if not result.ok:
+                failed.append(source["name"])
+                continue
+            indexes[source["name"]] = update_feed(source, result, manifest, report)
+    report.stage("update", feeds=len(SOURCES) - len(failed))
+
+    state.save()
+    manifest.save()
+    manifest.report()
+    report.put("manifest", manifest.stages)
+    report.put("failed", failed)
+    report.print()
+    report.write(REPORT)
+
+    if failed:
+        print(f"Skipped {len(failed)} failed feed(s): {', '.join(failed)}")
+    return indexes
+
+
+if __name__ == "__main__":
+    main()
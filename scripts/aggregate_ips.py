@@ -1,152 +1,301 @@
 #!/usr/bin/env python3
 
+import hashlib
 import ipaddress
+import os
+import time
 import requests
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
 from pathlib import Path
-# Sources below are intentionally duplicated with aggregation for the purposes of adding recency bias and consensus based weighting.
+
+from aggregate_feeds import MANIFEST as FEED_MANIFEST, WINDOWS
+from exclusions import IP_ALLOW, IP_DENY, Exclusions
+from fetching import CHUNK_SIZE, REPO_RAW_URL, iter_lines, read_lines, resolve_local
+from firewall import compile_list, firewall_files
+from ipcount import PackedCounter, Rollup
+from manifest import Manifest, digest, file_digest
+from provenance import Consensus, Layout, tag
+from run_report import RunReport
+from scoring import decay, feed_scores, step
+
+# This repo's own feeds (aggregated/<feed>/) are read once and weighted by
+# recency, see SCORING; plain URLs count one hit per line. Order matters:
+# ranking ties go to the network seen first.
+#   {"feed": name}                    scored over all four windows
+#   {"feed": name, "windows": [...]}  step scoring over just these windows
+#   {"feed": name, "weight": w}       multiplies the feed's scores
 SOURCES = [
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tor_exits/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tor_exits/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tor_exits/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tor_exits/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/socks_proxy/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/socks_proxy/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/socks_proxy/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/socks_proxy/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sslproxies/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sslproxies/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sslproxies/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sslproxies/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/botscout/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/botscout/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/botscout/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/botscout/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sblam/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sblam/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sblam/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/sblam/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de_strongips/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de_strongips/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de_strongips/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de_strongips/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bruteforceblocker/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bruteforceblocker/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bruteforceblocker/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bruteforceblocker/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/dshield/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/dshield/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/dshield/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/dshield/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_compromised/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_compromised/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_compromised/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_compromised/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/spamhaus_drop/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/spamhaus_drop/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/spamhaus_drop/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_block/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_block/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_block/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/et_block/1d.txt",
-    "https://iplists.firehol.org/files/blocklist_net_ua.ipset",
-    "https://iplists.firehol.org/files/firehol_proxies.netset",
-    "https://iplists.firehol.org/files/firehol_level2.netset",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_1/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_1/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_1/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_1/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_2/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_2/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_2/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_2/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_3/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_3/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_3/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_3/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_4/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_4/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_4/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_4/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_5/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_5/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_5/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_5/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_6/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_6/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_6/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_6/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_7/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_7/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_7/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_7/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_8/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_8/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_8/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ipsum_8/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/iocs/tweetfeed_yearly_ips.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tweetfeed/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tweetfeed/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tweetfeed/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/tweetfeed/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bds_atif/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bds_atif/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bds_atif/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/bds_atif/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ciarmy/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ciarmy/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ciarmy/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/ciarmy/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/blocklist_de/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/threatView/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/threatView/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/threatView/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/threatView/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/hagezi_tif_ips/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/hagezi_tif_ips/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/hagezi_tif_ips/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/hagezi_tif_ips/1d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/rutgers_DROP/90d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/rutgers_DROP/30d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/rutgers_DROP/7d.txt",
-    "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/aggregated/rutgers_DROP/1d.txt"
+    {"feed": "tor_exits"},
+    {"feed": "socks_proxy"},
+    {"feed": "sslproxies"},
+    {"feed": "botscout"},
+    {"feed": "sblam"},
+    {"feed": "blocklist_de_strongips"},
+    {"feed": "bruteforceblocker"},
+    {"feed": "dshield"},
+    {"feed": "et_compromised"},
+    {"feed": "spamhaus_drop", "windows": ["30d", "7d", "1d"]},
+    {"feed": "et_block"},
+    {"url": "https://iplists.firehol.org/files/blocklist_net_ua.ipset"},
+    {"url": "https://iplists.firehol.org/files/firehol_proxies.netset"},
+    {"url": "https://iplists.firehol.org/files/firehol_level2.netset"},
+    {"feed": "ipsum_1"},
+    {"feed": "ipsum_2"},
+    {"feed": "ipsum_3"},
+    {"feed": "ipsum_4"},
+    {"feed": "ipsum_5"},
+    {"feed": "ipsum_6"},
+    {"feed": "ipsum_7"},
+    {"feed": "ipsum_8"},
+    {"url": "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/iocs/tweetfeed_yearly_ips.txt"},
+    {"feed": "tweetfeed"},
+    {"feed": "bds_atif"},
+    {"feed": "ciarmy"},
+    {"feed": "blocklist_de"},
+    {"feed": "threatView"},
+    {"feed": "hagezi_tif_ips"},
+    {"feed": "rutgers_DROP"}
+]
+
+# Recency scoring for {"feed": ...} sources (scoring.py):
+#   "step"   one point per window the indicator falls in, the same counts as
+#            listing each window file as its own source
+#   "decay"  halves every HALF_LIFE days
+#   "consensus"  one vote per group of sources that listed the address
+#            within CONSENSUS_WINDOW, however many windows or files it was
+#            in (provenance.py); plain URLs take part too
+SCORING = "step"
+HALF_LIFE = 7
+
+# Sources derived from one another vote once, as a group. With
+# CONSENSUS_WEIGHTED a group's vote is worth the largest "weight" among its
+# members that listed the address.
+CONSENSUS_GROUPS = [
+    ["ipsum_1", "ipsum_2", "ipsum_3", "ipsum_4", "ipsum_5", "ipsum_6", "ipsum_7", "ipsum_8"],
+    ["blocklist_de", "blocklist_de_strongips"],
+    ["tweetfeed", "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/iocs/tweetfeed_yearly_ips.txt"],
 ]
-# Sources above are intentionally duplicated with aggregation for the purposes of adding recency bias and consensus based weighting.
+CONSENSUS_WINDOW = "90d"
+CONSENSUS_WEIGHTED = True
+
 OUTPUT_FILE = Path("output/aggregated.txt")
 MAX_LINES = 10_000
 PROMOTE_THRESHOLD = 240
 
-def fetch_ips(url):
-    response = requests.get(url, timeout=30)
-    response.raise_for_status()
+# IPv6: a /32 is listed whole once it holds this many listed /48s, and a
+# /48 once it holds this many listed /64s.
+V6_PROMOTE_32 = 8
+V6_PROMOTE_48 = 8
+
+# Every profile is rendered from the same counts:
+# (promote threshold, max lines, output file, mode)
+#   "prefix"  IPv4: promoted "a.b." /16s, then "a.b.c." /24s
+#   "cidr"    IPv4: best variable-length CIDRs for the line budget (ipcount/cidr_collapse)
+#   "v6"      IPv6 CIDRs: promoted /32s, promoted /48s, then /64s; the
+#             threshold is (V6_PROMOTE_32, V6_PROMOTE_48)
+PROFILES = [
+    (PROMOTE_THRESHOLD, MAX_LINES, OUTPUT_FILE, "prefix"),
+    (205, MAX_LINES, Path("output/aggregated_205_80.txt"), "prefix"),
+    (PROMOTE_THRESHOLD, MAX_LINES, Path("output/aggregated_cidr.txt"), "cidr"),
+    ((V6_PROMOTE_32, V6_PROMOTE_48), MAX_LINES, Path("output/aggregated_v6.txt"), "v6"),
+]
+
+# Content hashes of the inputs and outputs of the last run. When every input
+# hashes the same as last time and the outputs are intact, nothing is counted.
+MANIFEST = Path("output/manifest.json")
+REPORT = Path("output/run_report.json")
+# Plain URL sources are downloaded here, one file per URL, overwritten each run.
+DOWNLOAD_DIR = Path(".cache/aggregate_ips")
+FETCHED = ("path", "sha256")  # keys prefetch() adds to a source
+
+ENGINE = "packed"  # "objects" is the original ipaddress-based implementation
+WORKERS = os.cpu_count() or 1  # processes for the packed engine; 1 counts in this process
+
+
+def fetch_lines(url):
+    with requests.get(url, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        yield from iter_lines(response)
+
+
+def source_lines(url):
+    # This repo's own aggregated/ and iocs/ files are read from the checkout;
+    # only true external feeds go over the network.
+    path = resolve_local(url)
+    if path is not None:
+        return read_lines(path)
+    print(f"Fetching {url}")
+    return fetch_lines(url)
+
+
+def fetch_body(url):
+    # (path, sha256, size, HTTP status). The body is hashed as it streams to
+    # disk, so no source is ever held in memory; a file in the checkout is
+    # hashed where it is and its status is None.
+    path = resolve_local(url)
+    if path is not None:
+        return path, file_digest(path), path.stat().st_size, None
+    print(f"Fetching {url}")
+    path = DOWNLOAD_DIR / f"{digest(url)}.txt"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    with requests.get(url, timeout=30, stream=True) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                h.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+    return path, h.hexdigest(), size, response.status_code
+
+
+def prefetch(sources, report=None):
+    # Plain URL sources are downloaded up front so their hashes are known
+    # before anything is counted; counting reads them back from disk.
+    fetched = []
+    for source in sources:
+        if "url" in source:
+            start = time.perf_counter()
+            path, sha256, size, status = fetch_body(source["url"])
+            source = dict(source, path=path, sha256=sha256)
+            if report is not None:
+                report.source(source_name(source), status=status, bytes=size,
+                              seconds=round(time.perf_counter() - start, 3))
+        fetched.append(source)
+    return fetched
 
-    for line in response.text.splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
+
+def inputs_digest(sources, feed_manifest):
+    # One hash over everything the outputs depend on: settings, the scripts
+    # themselves, each feed's window files and each fetched body. None when
+    # the outputs also depend on the date (decay scoring), so the run always
+    # counts.
+    if SCORING == "decay":
+        return None
+    parts = [repr((PROFILES, ENGINE, SCORING))]
+    parts += [
+        file_digest(path) if path.exists() else None
+        for path in [*IP_ALLOW, *IP_DENY]
+    ]
+    if SCORING == "consensus":
+        parts.append(repr((CONSENSUS_GROUPS, CONSENSUS_WINDOW, CONSENSUS_WEIGHTED)))
+    parts += [file_digest(path) for path in sorted(Path(__file__).parent.glob("*.py"))]
+    for source in sources:
+        parts.append(repr(sorted((k, v) for k, v in source.items() if k not in FETCHED)))
+        if "sha256" in source:
+            parts.append(source["sha256"])
             continue
+        for url in source_urls(source):
+            path = resolve_local(url)
+            if path is None:
+                return None
+            parts.append(feed_manifest.get(path) or file_digest(path))
+    return digest("\n".join(map(str, parts)))
+
+
+def feed_score(source):
+    if SCORING == "step":
+        score = step(source.get("windows", WINDOWS))
+    elif SCORING == "decay":
+        score = decay(HALF_LIFE)
+    else:
+        raise ValueError(f"unknown scoring {SCORING!r}")
+    weight = source.get("weight", 1)
+    return lambda age: weight * score(age)
+
+
+def consensus_layout():
+    return Layout(
+        [(source_name(source), source.get("windows", list(WINDOWS)) if "feed" in source else None,
+          source.get("weight", 1)) for source in SOURCES],
+        CONSENSUS_GROUPS,
+    )
+
+
+def consensus():
+    # The Rollup score for SCORING "consensus"; None otherwise.
+    if SCORING != "consensus":
+        return None
+    return Consensus(consensus_layout(), CONSENSUS_WINDOW, CONSENSUS_WEIGHTED)
+
+
+def window_mask(windows):
+    # Bit i is set while the indicator is within windows[i].
+    spans = [WINDOWS[label] for label in windows]
+
+    def mask(age):
+        return sum(1 << i for i, span in enumerate(spans) if age < span)
+    return mask
+
+
+def open_source(source, read=source_lines):
+    # (lines, weights, tags) for one SOURCES entry. weights is None for plain
+    # URLs; tags is None unless SCORING is "consensus", where each source
+    # carries its position in SOURCES as "index".
+    if SCORING == "consensus":
+        if "feed" in source:
+            windows = source.get("windows", list(WINDOWS))
+            lines, masks = feed_scores(source["feed"], window_mask(windows))
+            return lines, None, [tag(source["index"], int(m)) for m in masks]
+        lines = read_lines(source["path"]) if "path" in source else read(source["url"])
+        return lines, None, repeat(tag(source["index"]))
+    if "feed" in source:
+        return (*feed_scores(source["feed"], feed_score(source)), None)
+    if "path" in source:
+        return read_lines(source["path"]), None, None
+    return read(source["url"]), None, None
+
+
+def source_name(source):
+    return source.get("feed") or source["url"]
+
+
+def source_urls(source):
+    # The files a source stood for before scoring: a feed's window files,
+    # largest first, each counted once.
+    if "feed" not in source:
+        return [source["url"]]
+    windows = sorted(source.get("windows", WINDOWS), key=WINDOWS.get, reverse=True)
+    return [f"{REPO_RAW_URL}aggregated/{source['feed']}/{label}.txt" for label in windows]
+
+
+def parse_ips(lines):
+    # IPv4 only; IPv6 has its own rollup in the packed engine.
+    for line in lines:
         try:
-            yield ipaddress.ip_address(line)
+            ip = ipaddress.ip_address(line)
         except ValueError:
             continue
+        if ip.version == 4:
+            yield ip
+
 
-def main():
-    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+def aggregate_objects(line_sources, profiles=((PROMOTE_THRESHOLD, MAX_LINES, "prefix"),),
+                      exclusions=None):
+    if any(mode != "prefix" for _, _, mode in profiles):
+        raise ValueError("the objects engine only renders prefix profiles")
 
     ip_counts = Counter()
-    for source in SOURCES:
-        for ip in fetch_ips(source):
+    for lines in line_sources:
+        for ip in parse_ips(lines):
             ip_counts[ip] += 1
 
     if not ip_counts:
-        OUTPUT_FILE.write_text("")
-        return
+        return [[] for _ in profiles]
 
     net24_counts = Counter()
     net16_to_24s = defaultdict(set)
 
+    def excluded(net):
+        return exclusions is not None and bool(
+            exclusions.v4_excluded([int(net.network_address) >> (32 - net.prefixlen)],
+                                   net.prefixlen)[0]
+        )
+
     for ip, count in ip_counts.items():
         net24 = ipaddress.ip_network((ip, 24), strict=False)
         net16 = ipaddress.ip_network((ip, 16), strict=False)
@@ -154,48 +303,193 @@ def main():
         net24_counts[net24] += count
         net16_to_24s[net16].add(net24)
 
-    promoted_16s = {
-        net16: len(net24s)
-        for net16, net24s in net16_to_24s.items()
-        if len(net24s) >= PROMOTE_THRESHOLD
-    }
-
-    remaining_24s = {
-        net24: count
-        for net24, count in net24_counts.items()
-        if ipaddress.ip_network((net24.network_address, 16), strict=False)
-        not in promoted_16s
-    }
-
-    sorted_16s = sorted(
-        promoted_16s.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )
+    for net24 in [net24 for net24 in net24_counts if excluded(net24)]:
+        del net24_counts[net24]
+        net16 = ipaddress.ip_network((net24.network_address, 16), strict=False)
+        net16_to_24s[net16].discard(net24)
+
+    results = []
+    for threshold, max_lines, _ in profiles:
+        promoted_16s = {
+            net16: len(net24s)
+            for net16, net24s in net16_to_24s.items()
+            if len(net24s) >= threshold and not excluded(net16)
+        }
+
+        remaining_24s = {
+            net24: count
+            for net24, count in net24_counts.items()
+            if ipaddress.ip_network((net24.network_address, 16), strict=False)
+            not in promoted_16s
+        }
+
+        sorted_16s = sorted(
+            promoted_16s.items(),
+            key=lambda x: x[1],
+            reverse=True
+        )
+
+        sorted_24s = sorted(
+            remaining_24s.items(),
+            key=lambda x: x[1],
+            reverse=True
+        )
+
+        lines = []
+
+        for net16, _ in sorted_16s:
+            if len(lines) >= max_lines:
+                break
+            octets = str(net16.network_address).split(".")[:2]
+            lines.append(".".join(octets) + ".")
+
+        for net24, _ in sorted_24s:
+            if len(lines) >= max_lines:
+                break
+            octets = str(net24.network_address).split(".")[:3]
+            lines.append(".".join(octets) + ".")
+
+        results.append(list(dict.fromkeys(lines))[:max_lines])
+
+    return results
+
+
+def count_packed(line_sources):
+    counter = PackedCounter()
+    for lines in line_sources:
+        counter.add_lines(lines)
+    return counter
+
+
+def count_source(source, read=source_lines):
+    counter = PackedCounter()
+    counter.add_lines(*open_source(source, read))
+    return counter
 
-    sorted_24s = sorted(
-        remaining_24s.items(),
-        key=lambda x: x[1],
-        reverse=True
+
+def count_sources(sources, read=source_lines, report=None):
+    counter = PackedCounter()
+    for source in sources:
+        entries, rejected = len(counter), counter.rejected
+        counter.add_lines(*open_source(source, read))
+        if report is not None:
+            report.source(source_name(source), parsed=len(counter) - entries,
+                          rejected=counter.rejected - rejected)
+    return counter
+
+
+def count_parallel(sources, read=source_lines, workers=WORKERS, report=None):
+    # Map: each worker fetches and counts whole sources into a PackedCounter,
+    # which pickles as a few flat integer buffers. Reduce: merge the parts in
+    # source order, so stream positions (and the output) match a serial run.
+    counter = PackedCounter()
+    with ProcessPoolExecutor(workers) as pool:
+        for source, part in zip(sources, pool.map(partial(count_source, read=read), sources)):
+            if report is not None:
+                report.source(source_name(source), parsed=len(part), rejected=part.rejected)
+            counter.merge(part)
+    return counter
+
+
+def render_packed(counter, profiles, exclusions=None):
+    return render_rollup(
+        Rollup(counter, consensus(), exclusions) if len(counter) else None, profiles
     )
 
-    lines = []
 
-    for net16, _ in sorted_16s:
-        if len(lines) >= MAX_LINES:
-            break
-        octets = str(net16.network_address).split(".")[:2]
-        lines.append(".".join(octets) + ".")
+def render_rollup(rollup, profiles):
+    if rollup is None:
+        return [[] for _ in profiles]
+
+    render = {"prefix": rollup.lines, "cidr": rollup.cidr_lines, "v6": rollup.v6_lines}
+    return [render[mode](threshold, max_lines) for threshold, max_lines, mode in profiles]
+
+
+def aggregate_packed(line_sources, profiles=((PROMOTE_THRESHOLD, MAX_LINES, "prefix"),),
+                     exclusions=None):
+    return render_packed(count_packed(line_sources), profiles, exclusions)
+
+
+ENGINES = {
+    "objects": aggregate_objects,
+    "packed": aggregate_packed,
+}
+
+
+def finish(report, manifest):
+    manifest.report()
+    report.put("manifest", manifest.stages)
+    report.print()
+    report.write(REPORT)
+
+
+def main(workers=WORKERS):
+    report = RunReport("aggregate_ips")
+    manifest = Manifest(MANIFEST)
+    sources = SOURCES if ENGINE == "objects" else prefetch(SOURCES, report)
+    if SCORING == "consensus":
+        sources = [dict(source, index=i) for i, source in enumerate(sources)]
+    report.stage("fetch", sources=len(sources))
+
+    inputs = inputs_digest(sources, Manifest(FEED_MANIFEST))
+    outputs = [path for _, _, output_file, _ in PROFILES
+               for path in [output_file, *firewall_files(output_file)]]
+    intact = all(path.exists() and manifest.get(path) == file_digest(path) for path in outputs)
+    report.stage("fingerprint")
+    if inputs is not None and inputs == manifest.get("inputs") and intact:
+        print("Inputs unchanged since the last run")
+        manifest.stage("count", False)
+        finish(report, manifest)
+        return
+    manifest.stage("count", True)
+
+    profiles = [(threshold, max_lines, mode) for threshold, max_lines, _, mode in PROFILES]
+    exclusions = Exclusions.load(domain_allow=(), domain_deny=())
+    report.stage("exclusions", v4_ranges=len(exclusions.v4), v6_ranges=len(exclusions.v6))
+    if ENGINE == "objects":
+        # The reference engine has no weights; feeds are read back as their
+        # window files instead.
+        if SCORING != "step" or any(source.get("weight", 1) != 1 for source in SOURCES):
+            raise ValueError("the objects engine only supports unweighted step scoring")
+        urls = [url for source in SOURCES for url in source_urls(source)]
+        with report.profile("count"):
+            results = aggregate_objects((source_lines(url) for url in urls), profiles, exclusions)
+        report.stage("count")
+    else:
+        with report.profile("count"):
+            if workers > 1:
+                counter = count_parallel(sources, workers=workers, report=report)
+            else:
+                counter = count_sources(sources, report=report)
+        report.stage("count", entries=len(counter), rejected=counter.rejected,
+                     v6=counter.v6_count, ranges=len(counter.ranges))
+
+        with report.profile("rollup"):
+            rollup = Rollup(counter, consensus(), exclusions) if len(counter) else None
+        del counter
+        if rollup is not None:
+            report.stage("rollup", nets_24=len(rollup.net24), nets_16=len(rollup.net16),
+                         v6_nets_64=len(rollup.v6_net64))
+        results = render_rollup(rollup, profiles)
+        report.stage("render", lines=sum(map(len, results)))
 
-    for net24, _ in sorted_24s:
-        if len(lines) >= MAX_LINES:
-            break
-        octets = str(net24.network_address).split(".")[:3]
-        lines.append(".".join(octets) + ".")
+    for (_, _, output_file, mode), lines in zip(PROFILES, results):
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        text = "\n".join(lines) + "\n" if lines else ""
+        # Firewall loaders and the diff against what the file held before.
+        previous = output_file.read_text() if output_file.exists() else ""
+        compiled = compile_list(output_file, lines, previous.split(), digest(previous),
+                                digest(text), v6=mode == "v6")
+        manifest.stage("write", manifest.write_text(output_file, text))
+        for path, data in compiled.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            manifest.stage("firewall", manifest.write_bytes(path, data))
 
-    lines = list(dict.fromkeys(lines))[:MAX_LINES]
+    manifest.put("inputs", inputs)
+    manifest.save()
+    report.stage("write", files=len(outputs))
+    finish(report, manifest)
 
-    OUTPUT_FILE.write_text("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+# Variable-length CIDR selection over the /24 table.
+#
+# The /24s form the leaves of a binary prefix trie. A shorter prefix may be
+# emitted as one line only if it is dense enough: the share of its /24s that
+# are listed must reach threshold / 256. That is the /16 promotion rule
+# applied at every length. Within the line budget we pick the set of
+# disjoint prefixes that covers the most weighted hits.
+#
+# This is a knapsack over a tree. It is solved with a Lagrangian relaxation:
+# each line costs `lam` and a bottom-up pass picks, at every node, either
+# the node itself or the best split of its children. A binary search over
+# `lam` finds the cheapest cost that fits the budget, and any lines left
+# over are topped up with the heaviest uncovered /24s.
+
+MIN_PREFIX = 8
+SEARCH_STEPS = 60
+
+
+class PrefixTrie:
+    def __init__(self, net24, weight24, min_prefix=MIN_PREFIX, excluded=None):
+        # excluded(keys, prefix) -> bool array of prefixes that may not be
+        # emitted whole (exclusions.Exclusions.v4_excluded).
+        order = np.argsort(net24)
+        keys = np.asarray(net24, dtype=np.int64)[order]
+        weights = np.asarray(weight24, dtype=np.float64)[order]
+        listed = np.ones(len(keys), dtype=np.int64)
+
+        # levels[i] describes prefix length 24 - i.
+        self.min_prefix = min_prefix
+        self.levels = [(keys, weights, listed, None)]
+        for _ in range(24 - min_prefix):
+            parent_keys = keys >> 1
+            starts = _group_starts(parent_keys)
+            keys = parent_keys[starts]
+            weights = np.add.reduceat(weights, starts) if len(starts) else weights
+            listed = np.add.reduceat(listed, starts) if len(starts) else listed
+            self.levels.append((keys, weights, listed, starts))
+        self.excluded = [
+            excluded(keys, 24 - depth) if excluded is not None else None
+            for depth, (keys, _, _, _) in enumerate(self.levels)
+        ]
+
+    def _solve(self, lam, threshold):
+        keys, weights, _, _ = self.levels[0]
+        value = np.maximum(weights - lam, 0)
+        lines = (weights - lam > 0).astype(np.int64)
+        takes = [lines.astype(bool)]
+
+        for depth, (keys, weights, listed, starts) in enumerate(self.levels[1:], 1):
+            child_value = np.add.reduceat(value, starts) if len(starts) else value
+            child_lines = np.add.reduceat(lines, starts) if len(starts) else lines
+            own = weights - lam
+            eligible = listed >= np.ceil(threshold * 2.0 ** depth / 256)
+            if self.excluded[depth] is not None:
+                eligible &= ~self.excluded[depth]
+            take = eligible & ((own > child_value) | ((own == child_value) & (child_lines > 1)))
+            value = np.where(take, own, child_value)
+            lines = np.where(take, 1, child_lines)
+            takes.append(take)
+
+        return int(lines.sum()), takes
+
+    def select(self, threshold, max_lines):
+        # Returns [(network int, prefix length, weight)] sorted by address.
+        if not len(self.levels[0][0]) or max_lines <= 0:
+            return []
+
+        lo, hi = 0.0, float(self.levels[-1][1].max()) + 1
+        _, takes = self._solve(hi, threshold)
+        for _ in range(SEARCH_STEPS):
+            mid = (lo + hi) / 2
+            count, mid_takes = self._solve(mid, threshold)
+            if count <= max_lines:
+                hi, takes = mid, mid_takes
+            else:
+                lo = mid
+
+        selected, covered = [], None
+        for depth in range(len(self.levels) - 1, -1, -1):
+            keys, weights, _, _ = self.levels[depth]
+            take = takes[depth]
+            if covered is None:
+                covered = np.zeros(len(keys), dtype=bool)
+            chosen = take & ~covered
+            prefix = 24 - depth
+            for key, weight in zip(keys[chosen].tolist(), weights[chosen].tolist()):
+                selected.append((key << (32 - prefix), prefix, weight))
+            covered = covered | chosen
+            if depth:
+                starts = self.levels[depth][3]
+                covered = np.repeat(covered, np.diff(np.append(starts, len(self.levels[depth - 1][0]))))
+
+        # Spend whatever budget the relaxation left on the heaviest /24s.
+        spare = max_lines - len(selected)
+        if spare > 0:
+            keys, weights, _, _ = self.levels[0]
+            rest = np.flatnonzero(~covered)
+            rest = rest[np.argsort(-weights[rest], kind="stable")[:spare]]
+            selected += [(key << 8, 24, weight)
+                         for key, weight in zip(keys[rest].tolist(), weights[rest].tolist())]
+
+        return sorted(selected)
+
+
+def format_cidr(network, prefix):
+    return f"{network >> 24}.{(network >> 16) & 255}.{(network >> 8) & 255}.{network & 255}/{prefix}"
+
+
+def _group_starts(sorted_keys):
+    if not len(sorted_keys):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
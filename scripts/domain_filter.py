@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+import re
+from itertools import chain
+
+# Domain filtering for filter.py.
+#
+# Domains are stored as reversed keys: "evil.example.com" becomes
+# "moc\telpmaxe\tlive", the whole string reversed with dots turned into
+# tabs. A parent is a prefix of its children ending at a tab, and tab sorts
+# below every character allowed in a hostname, so in sorted order a domain
+# is immediately followed by all of its subdomains. Reversing and
+# translating are single string operations over a whole chunk of input, so
+# no per-line Python string handling is needed while loading.
+#
+# Modes for subtracting the allow list (Tranco) from the block list:
+#   exact   drop a domain only if it is listed itself
+#   parent  also drop it if any parent domain is listed
+#           (evil.example.com goes when example.com is popular)
+#   child   also drop it if any subdomain is listed
+#           (example.com goes when www.example.com is popular)
+#
+# Parent matches need at least PARENT_MIN_LABELS labels, so a bare TLD in the
+# allow list never whitelists everything under it, and never use a parent in
+# SHARED_SUFFIXES. Those are suffixes whose subdomains belong to unrelated
+# owners: second-level public suffixes (co.uk) and hosting or dynamic DNS
+# domains (github.io, duckdns.org). Tranco ranks several of them, and a
+# parent match on one would whitelist every blocklisted site hosted under
+# it. The list is curated, not the full Public Suffix List, so parent mode
+# is only as safe as it is complete: a shared suffix missing here counts as
+# a registrable domain.
+#
+# The allow list is a set of keys; child mode adds the set of every listed
+# key's parents. No mode needs the keys sorted, and filter.py takes exact
+# mode as a set difference against the streamed Tranco keys.
+
+SEP = "\t"
+MODES = ("exact", "parent", "child")
+PARENT_MIN_LABELS = 2
+CHUNK_SIZE = 1 << 22
+
+SHARED_SUFFIXES = (
+    # second-level public suffixes
+    "ac.in", "ac.jp", "ac.uk", "co.id", "co.il", "co.in", "co.jp", "co.kr", "co.nz",
+    "co.th", "co.uk", "co.za", "com.ar", "com.au", "com.br", "com.cn", "com.co",
+    "com.eg", "com.hk", "com.mx", "com.my", "com.ng", "com.ph", "com.pk", "com.pl",
+    "com.sa", "com.sg", "com.tr", "com.tw", "com.ua", "com.vn", "edu.au", "edu.cn",
+    "gov.au", "gov.br", "gov.cn", "gov.in", "gov.uk", "ne.jp", "net.au", "net.br",
+    "net.cn", "net.in", "or.jp", "or.kr", "org.au", "org.br", "org.cn", "org.in",
+    "org.nz", "org.uk", "org.za",
+    # hosting, storage and tunnels
+    "000webhostapp.com", "amazonaws.com", "appspot.com", "azureedge.net",
+    "azurestaticapps.net", "azurewebsites.net", "bitbucket.io", "blogspot.com",
+    "cloudapp.net", "cloudfront.net", "dweb.link", "firebaseapp.com", "fly.dev",
+    "github.io", "githubusercontent.com", "gitlab.io", "glitch.me", "herokuapp.com",
+    "myshopify.com", "neocities.org", "netlify.app", "ngrok-free.app", "ngrok.io",
+    "onrender.com", "pages.dev", "r2.dev", "readthedocs.io", "repl.co", "surge.sh",
+    "trycloudflare.com", "tumblr.com", "vercel.app", "web.app", "webflow.io",
+    "weebly.com", "windows.net", "wixsite.com", "wordpress.com", "workers.dev",
+    # dynamic DNS
+    "afraid.org", "ddns.net", "duckdns.org", "dynu.net", "dyndns.org", "hopto.org",
+    "myftp.org", "no-ip.biz", "no-ip.org", "serveftp.com", "sytes.net", "zapto.org",
+)
+
+TO_KEY = str.maketrans(".", SEP)
+FROM_KEY = str.maketrans(SEP, ".")
+
+COMMENT = re.compile(r"(?m)^[ \t]*#.*$")
+TRANCO_RANK = re.compile(r"(?m)^\d+,")
+
+
+def domain_key(domain):
+    return domain.translate(TO_KEY)[::-1]
+
+
+SHARED_SUFFIX_KEYS = frozenset(map(domain_key, SHARED_SUFFIXES))
+
+
+def key_domain(key):
+    return key[::-1].translate(FROM_KEY)
+
+
+def to_keys(domains):
+    # Newline-separated domains -> list of keys, in one pass per chunk.
+    if not domains:
+        return []
+    return domains.lower().translate(TO_KEY)[::-1].split("\n")
+
+
+def from_keys(keys):
+    if not keys:
+        return []
+    return "\n".join(keys)[::-1].translate(FROM_KEY).split("\n")
+
+
+def read_chunks(path):
+    # Whole lines, about CHUNK_SIZE characters at a time.
+    with open(path, encoding="utf-8", errors="replace", newline="") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk + f.readline()
+
+
+def read_domain_keys(path):
+    # One domain per line; blank lines and "#" comments are skipped.
+    return chain.from_iterable(map(_domain_chunk_keys, read_chunks(path)))
+
+
+def _domain_chunk_keys(chunk):
+    if "#" in chunk:
+        chunk = COMMENT.sub("", chunk)
+    return to_keys("\n".join(chunk.split()))
+
+
+def read_tranco_keys(path):
+    # "rank,domain" rows. A header row, if present, has no numeric rank and
+    # is skipped.
+    return chain.from_iterable(map(_tranco_chunk_keys, read_chunks(path)))
+
+
+def _tranco_chunk_keys(chunk):
+    rows = chunk.split()
+    fields = ",".join(rows).split(",")
+    if len(fields) == 2 * len(rows) and "".join(fields[0::2]).isdigit():
+        # Every row is a numeric rank and a domain.
+        return to_keys("\n".join(fields[1::2]))
+    domains = TRANCO_RANK.sub("", chunk).split()
+    return to_keys("\n".join(d for d in domains if "," not in d))
+
+
+class DomainIndex:
+    # Set of keys, and for child mode the set of their parents.
+    def __init__(self, keys):
+        self.keys = keys
+        self._parents = None
+
+    @classmethod
+    def from_keys(cls, keys):
+        return cls(set(keys))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def parents(self):
+        if self._parents is None:
+            parents = set()
+            for key in self.keys:
+                # Longest parent first; once one is known, so are the rest.
+                end = key.rfind(SEP)
+                while end != -1 and key[:end] not in parents:
+                    parents.add(key[:end])
+                    end = key.rfind(SEP, 0, end)
+            self._parents = parents
+        return self._parents
+
+
+def subtract(block_keys, allow, mode="exact"):
+    # Yields the block keys that survive subtraction of the allow index, in
+    # the order given.
+    if mode not in MODES:
+        raise ValueError(f"unknown mode {mode!r}")
+
+    listed = allow.keys
+    parents = allow.parents() if mode == "child" else ()
+    for key in block_keys:
+        if key in listed or key in parents:
+            continue
+        if mode == "parent" and _has_listed_parent(key, listed.__contains__):
+            continue
+        yield key
+
+
+def _has_listed_parent(key, listed):
+    # Parents are the prefixes of the key that end just before a tab.
+    end = key.find(SEP)
+    labels = 1
+    while end != -1:
+        parent = key[:end]
+        if labels >= PARENT_MIN_LABELS and parent not in SHARED_SUFFIX_KEYS and listed(parent):
+            return True
+        end = key.find(SEP, end + 1)
+        labels += 1
+    return False
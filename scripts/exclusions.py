@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+import ipaddress
+from pathlib import Path
+
+import numpy as np
+
+from domain_filter import PARENT_MIN_LABELS, SEP, read_domain_keys
+
+# Allow and deny lists applied to every published output.
+#
+# Allow lists name infrastructure that must never be blocked: addresses,
+# CIDRs, domains, and "*.example.com" wildcards (the domain and everything
+# under it). A deny entry overrides them, so anything on a deny list stays
+# listed even when an allow entry covers it; no list is used that way yet.
+#
+# The only allow list in the repo is domainWhitelist. There is no IP allow
+# list, so the IP lists below start empty; ipBlacklist.txt and
+# ipGreylist.txt are block lists, not exceptions, and are not read here.
+#
+# IP entries compile to sorted, disjoint closed intervals, IPv4 over
+# addresses and IPv6 over the upper 64 bits (no output is finer than a /64).
+# Whether a candidate network touches an allowed address is one binary
+# search, done for a whole array of networks at once. Domains compile to
+# sets of reversed keys (domain_filter.py); a wildcard is found by walking
+# the key's parents.
+
+IP_ALLOW = []
+IP_DENY = []
+DOMAIN_ALLOW = [Path("domainWhitelist")]
+DOMAIN_DENY = []
+
+WILDCARD = SEP + "*"
+
+
+def read_entries(path):
+    # Non-empty lines with "#" comments removed; a missing file is empty.
+    if not path.exists():
+        print(f"No exclusion list {path}")
+        return
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                yield line
+
+
+class IntervalSet:
+    # Sorted, disjoint closed intervals [starts[i], ends[i]].
+    def __init__(self, starts, ends, dtype):
+        self.starts = np.array(starts, dtype=dtype)
+        self.ends = np.array(ends, dtype=dtype)
+
+    @classmethod
+    def from_ranges(cls, ranges, dtype):
+        starts, ends = [], []
+        for first, last in sorted(ranges):
+            if ends and first <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], last)
+            else:
+                starts.append(first)
+                ends.append(last)
+        return cls(starts, ends, dtype)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlaps(self, first, last):
+        # Boolean array: does [first[i], last[i]] touch any interval?
+        first = np.asarray(first, dtype=self.ends.dtype)
+        last = np.asarray(last, dtype=self.ends.dtype)
+        if not len(self):
+            return np.zeros(len(first), dtype=bool)
+        i = np.searchsorted(self.ends, first)
+        inside = i < len(self)
+        hit = np.zeros(len(first), dtype=bool)
+        hit[inside] = self.starts[i[inside]] <= last[inside]
+        return hit
+
+
+def _subtract(ranges, holes):
+    # Closed integer ranges minus other closed integer ranges.
+    out = []
+    holes = sorted(holes)
+    for first, last in sorted(ranges):
+        for hole_first, hole_last in holes:
+            if hole_last < first or hole_first > last:
+                continue
+            if hole_first > first:
+                out.append((first, hole_first - 1))
+            first = hole_last + 1
+            if first > last:
+                break
+        if first <= last:
+            out.append((first, last))
+    return out
+
+
+def ip_ranges(paths):
+    # {4: [(first, last)], 6: [(first, last)]} as integers.
+    ranges = {4: [], 6: []}
+    for path in paths:
+        for entry in read_entries(path):
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+            ranges[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+    return ranges
+
+
+class Exclusions:
+    def __init__(self, v4, v6, domains, wildcards, denied_domains):
+        self.v4 = v4
+        self.v6 = v6
+        self.domains = domains
+        self.wildcards = wildcards
+        self.denied_domains = denied_domains
+
+    @classmethod
+    def load(cls, ip_allow=IP_ALLOW, ip_deny=IP_DENY, domain_allow=DOMAIN_ALLOW,
+             domain_deny=DOMAIN_DENY):
+        allow, deny = ip_ranges(ip_allow), ip_ranges(ip_deny)
+        v4 = _subtract(allow[4], deny[4])
+        v6 = [(first >> 64, last >> 64) for first, last in _subtract(allow[6], deny[6])]
+
+        domains, wildcards = set(), set()
+        for path in domain_allow:
+            if not path.exists():
+                print(f"No exclusion list {path}")
+                continue
+            for key in read_domain_keys(path):
+                if key.endswith(WILDCARD):
+                    key = key[:-len(WILDCARD)]
+                    if key.count(SEP) + 1 >= PARENT_MIN_LABELS:
+                        wildcards.add(key)
+                elif key:
+                    domains.add(key)
+        denied = set()
+        for path in domain_deny:
+            if path.exists():
+                denied.update(read_domain_keys(path))
+
+        return cls(
+            IntervalSet.from_ranges(v4, np.int64),
+            IntervalSet.from_ranges(v6, np.uint64),
+            domains,
+            wildcards,
+            denied,
+        )
+
+    def v4_excluded(self, nets, prefix):
+        # IPv4 networks (as from ipcount.Rollup: the address >> (32 - prefix))
+        # that contain an allowed address.
+        shift = 32 - prefix
+        first = np.asarray(nets, dtype=np.int64) << shift
+        return self.v4.overlaps(first, first + ((1 << shift) - 1))
+
+    def v6_excluded(self, nets, prefix):
+        # Same for IPv6 networks of at most 64 bits.
+        shift = np.uint64(64 - prefix)
+        first = np.asarray(nets, dtype=np.uint64) << shift
+        return self.v6.overlaps(first, first + ((np.uint64(1) << shift) - np.uint64(1)))
+
+    def allowed_key(self, key):
+        if key in self.denied_domains:
+            return False
+        if key in self.domains or key in self.wildcards:
+            return True
+        end = key.find(SEP)
+        while end != -1:
+            if key[:end] in self.wildcards:
+                return True
+            end = key.find(SEP, end + 1)
+        return False
+
+    def domain_keys(self, keys):
+        # The set of keys (domain_filter.domain_key) that are not allowed. A
+        # wildcard covers its own key and every key that starts with it and
+        # a tab.
+        denied = self.denied_domains
+        kept = set(keys)
+        kept -= (self.domains | self.wildcards) - denied
+        if self.wildcards:
+            under = tuple(wildcard + SEP for wildcard in self.wildcards)
+            kept = {key for key in kept if not key.startswith(under) or key in denied}
+        return kept
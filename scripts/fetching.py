@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import codecs
+import hashlib
+import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared fetch stage: bounded thread pool, one pooled session per host,
+# ETag/Last-Modified conditional requests and per-source retry with backoff.
+# A source that still fails after its retries is reported in its result and
+# never takes the other sources down with it.
+#
+# With a FetchState the body is also hashed, chunk by chunk as parse()
+# streams it, so memory stays as flat as a plain fetch. When the body turns
+# out identical to the one the cached snapshot came from, the parsed result
+# is dropped and the source is reported like a 304 (with `unchanged` set).
+
+MAX_WORKERS = 8
+TIMEOUT = 30
+RETRIES = 3
+BACKOFF = 2.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 64 * 1024
+LOCAL_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+REPO_RAW_URL = "https://raw.githubusercontent.com/ibell63/lists/refs/heads/master/"
+
+
+@dataclass
+class FetchResult:
+    name: str
+    url: str
+    status: Optional[int] = None
+    data: Any = None
+    not_modified: bool = False
+    unchanged: bool = False
+    bytes: int = 0
+    snapshot: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class FetchState:
+    # Conditional request validators and the body's sha256 per URL, plus the
+    # caller's tag for the snapshot that was stored from that response.
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def get(self, url):
+        with self.lock:
+            return dict(self.entries.get(url, {}))
+
+    def put(self, url, response, snapshot, sha256=None):
+        entry = {"snapshot": snapshot}
+        if sha256:
+            entry["sha256"] = sha256
+        if response.headers.get("ETag"):
+            entry["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            entry["last_modified"] = response.headers["Last-Modified"]
+        with self.lock:
+            if len(entry) > 1:
+                self.entries[url] = entry
+            else:
+                self.entries.pop(url, None)
+
+    def drop(self, url):
+        with self.lock:
+            self.entries.pop(url, None)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True) + "\n")
+
+
+class SessionPool:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount(host, adapter)
+                self.sessions[host] = session
+            return session
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+
+def iter_lines(response, chunk_size=CHUNK_SIZE):
+    # Stream a response body as stripped, non-empty, non-comment lines. Only
+    # one chunk and one partial line are held at a time, so memory stays flat
+    # however large the feed is. Content-Encoding is undone by requests; a
+    # body that is itself a .gz file is inflated here.
+    return _split_lines(response.iter_content(chunk_size), response.encoding or "utf-8")
+
+
+def resolve_local(url, root=Path(".")):
+    # Files from this repository are already in the working tree.
+    if url.startswith(REPO_RAW_URL):
+        path = root / url[len(REPO_RAW_URL):]
+        if path.is_file():
+            return path
+    return None
+
+
+def read_lines(path, chunk_size=LOCAL_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        yield from _split_lines(iter(lambda: f.read(chunk_size), b""), "utf-8")
+
+
+def _split_lines(chunks, encoding):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    inflate = None
+    pending = ""
+
+    for chunk in chunks:
+        if inflate is None:
+            inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(GZIP_MAGIC) else False
+        if inflate:
+            chunk = inflate.decompress(chunk)
+
+        lines = (pending + decoder.decode(chunk)).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+    tail = pending + decoder.decode(inflate.flush() if inflate else b"", final=True)
+    for line in tail.split("\n"):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+class _Counted:
+    # A live response whose body bytes are counted, and hashed when asked, as
+    # parse() streams them.
+    def __init__(self, response, hashed=False):
+        self.response = response
+        self.encoding = response.encoding
+        self.headers = response.headers
+        self.url = response.url
+        self.size = 0
+        self.hash = hashlib.sha256() if hashed else None
+        self.chunks = None
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        if self.chunks is None:
+            self.chunks = self.response.iter_content(chunk_size)
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            if self.hash is not None:
+                self.hash.update(chunk)
+            yield chunk
+
+    def sha256(self):
+        # Whatever parse() left unread still belongs to the body.
+        for _ in self.iter_content():
+            pass
+        return self.hash.hexdigest()
+
+
+def _retry_delay(response, attempt, backoff):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(int(retry_after), 60)
+    return backoff * (2 ** attempt)
+
+
+def fetch_source(name, url, parse, pool, state=None, snapshot=None,
+                 timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    result = FetchResult(name=name, url=url)
+    headers = {}
+    cached = state.get(url) if state is not None else {}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    session = pool.get(url)
+    start = time.monotonic()
+
+    for attempt in range(retries + 1):
+        result.attempts = attempt + 1
+        response = None
+        try:
+            response = session.get(url, headers=headers, timeout=timeout, stream=True)
+            result.status = response.status_code
+
+            if response.status_code == 304:
+                if not cached:
+                    raise requests.HTTPError("HTTP 304 without a cached copy", response=response)
+                result.not_modified = True
+                result.snapshot = cached.get("snapshot")
+                result.error = None
+                break
+
+            if response.status_code in RETRY_STATUSES:
+                raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            response.raise_for_status()
+
+            # parse() consumes the body as it streams in.
+            body = _Counted(response, hashed=state is not None)
+            result.data = parse(body)
+            result.error = None
+            if state is not None:
+                sha256 = body.sha256()
+                if cached.get("snapshot") and sha256 == cached.get("sha256"):
+                    result.data = None
+                    result.not_modified = result.unchanged = True
+                    result.snapshot = cached["snapshot"]
+                state.put(url, response, snapshot, sha256)
+            result.bytes = body.size
+            break
+        except requests.RequestException as e:
+            result.error = f"{type(e).__name__}: {e}"
+            status = getattr(e.response, "status_code", None)
+            if status is not None and status not in RETRY_STATUSES:
+                break
+            if attempt < retries:
+                time.sleep(_retry_delay(response, attempt, backoff))
+        except Exception as e:
+            # A feed we cannot parse is a failed feed, not a failed run.
+            result.error = f"{type(e).__name__}: {e}"
+            break
+        finally:
+            if response is not None:
+                response.close()
+
+    result.elapsed = time.monotonic() - start
+    return result
+
+
+def fetch_all(sources, parse, state=None, snapshot=None, max_workers=MAX_WORKERS,
+              timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF):
+    # sources: iterable of (name, url). Returns {name: FetchResult} in the
+    # order the sources were given.
+    sources = list(sources)
+    pool = SessionPool(max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    fetch_source, name, url, parse, pool, state, snapshot,
+                    timeout, retries, backoff,
+                )
+                for name, url in sources
+            ]
+            results = {name: f.result() for (name, _), f in zip(sources, futures)}
+    finally:
+        pool.close()
+
+    for result in results.values():
+        print(format_result(result))
+
+    return results
+
+
+def format_result(result):
+    if not result.ok:
+        outcome = f"FAILED ({result.error})"
+    elif result.unchanged:
+        outcome = "unchanged"
+    elif result.not_modified:
+        outcome = "not modified"
+    else:
+        outcome = f"HTTP {result.status}"
+    retries = f", {result.attempts} attempts" if result.attempts > 1 else ""
+    return f"{result.name}: {outcome} in {result.elapsed:.2f}s{retries}"
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import ipaddress
+from pathlib import Path
+
+import numpy as np
+
+# Loader-native copies of the aggregate_ips.py outputs, written to
+# FIREWALL_DIR as <list>.<format> where <list> is the output file's stem:
+#
+#   .ipset       `ipset restore` script: fills a scratch hash:net set and
+#                swaps it in, so the live set is replaced atomically
+#   .nft         `nft -f` script: (re)creates an interval set in table
+#                FIREWALL_TABLE and replaces its elements in one transaction
+#   .ranges      the networks merged into sorted, disjoint ranges, one
+#                big-endian (first, last) row each: 8 bytes for IPv4, 32 for
+#                IPv6; no header
+#
+# and the change since the previous run, adds and removes only:
+#
+#   .diff        "+network" / "-network" lines
+#   .ipset.diff  `ipset restore` del/add lines for the live set
+#   .nft.diff    one `nft -f` transaction deleting and adding elements
+#
+# Each diff's first line names the sha256 of the list it applies to and of
+# the list it produces. A box that is not at the first one has missed a run
+# and must load the full script instead; the nft diff fails as a whole in
+# that case, since deleting an element the set does not hold is an error.
+
+FIREWALL_DIR = Path("output/firewall")
+FIREWALL_TABLE = "lists"
+IPSET_MIN_MAXELEM = 65536
+FORMATS = ("ipset", "nft", "ranges", "diff", "ipset.diff", "nft.diff")
+
+
+def line_network(line):
+    # Output lines are "a.b." (/16), "a.b.c." (/24) or a CIDR.
+    if line.endswith("."):
+        octets = line[:-1].split(".")
+        prefix = 8 * len(octets)
+        return ipaddress.ip_network(".".join(octets + ["0"] * (4 - len(octets))) + f"/{prefix}")
+    return ipaddress.ip_network(line)
+
+
+def networks(lines):
+    return sorted(map(line_network, lines))
+
+
+def previous_networks(lines, v6=False):
+    # The networks of what the output file held before this run. Files
+    # written before these formats existed hold lines no profile writes any
+    # more (such as the "2401:4900::." IPv6 prefixes in the IPv4 lists);
+    # no loader script ever carried those, so they are left out of the diff
+    # instead of failing the run.
+    version = 6 if v6 else 4
+    nets = []
+    for line in lines:
+        try:
+            net = line_network(line)
+        except ValueError:
+            continue
+        if net.version == version:
+            nets.append(net)
+    return sorted(nets)
+
+
+def ipset_script(name, nets, v6=False):
+    family = "inet6" if v6 else "inet"
+    maxelem = max(IPSET_MIN_MAXELEM, len(nets))
+    scratch = f"{name}-new"
+    out = [
+        f"create {name} hash:net family {family} maxelem {maxelem} -exist",
+        f"create {scratch} hash:net family {family} maxelem {maxelem} -exist",
+        f"flush {scratch}",
+    ]
+    out += [f"add {scratch} {net}" for net in nets]
+    out += [f"swap {scratch} {name}", f"destroy {scratch}"]
+    return "\n".join(out) + "\n"
+
+
+def _nft_set(name, v6):
+    kind = "ipv6_addr" if v6 else "ipv4_addr"
+    return f"add set inet {FIREWALL_TABLE} {name} {{ type {kind}; flags interval; }}"
+
+
+def _nft_elements(verb, name, nets):
+    if not nets:
+        return []
+    body = ",\n".join(f"    {net}" for net in nets)
+    return [f"{verb} element inet {FIREWALL_TABLE} {name} {{\n{body}\n}}"]
+
+
+def nft_script(name, nets, v6=False):
+    out = [f"add table inet {FIREWALL_TABLE}", _nft_set(name, v6),
+           f"flush set inet {FIREWALL_TABLE} {name}"]
+    out += _nft_elements("add", name, nets)
+    return "\n".join(out) + "\n"
+
+
+def range_table(nets, v6=False):
+    # Adjacent and overlapping networks merge into one row.
+    bounds = []
+    for net in nets:
+        first, last = int(net.network_address), int(net.broadcast_address)
+        if bounds and first <= bounds[-1][1] + 1:
+            bounds[-1][1] = max(bounds[-1][1], last)
+        else:
+            bounds.append([first, last])
+    if not v6:
+        return np.array(bounds, dtype=">u4").reshape(-1, 2).tobytes()
+    words = [(v >> 64, v & 0xFFFFFFFFFFFFFFFF) for row in bounds for v in row]
+    return np.array(words, dtype=">u8").reshape(-1, 4).tobytes()
+
+
+def diff(old_nets, new_nets):
+    # (added, removed), each sorted.
+    old, new = set(old_nets), set(new_nets)
+    return sorted(new - old), sorted(old - new)
+
+
+def diff_scripts(name, added, removed, old_digest, new_digest):
+    header = f"# {name}: +{len(added)} -{len(removed)} from {old_digest} to {new_digest}"
+    plain = [header] + [f"-{net}" for net in removed] + [f"+{net}" for net in added]
+    ipset = [header] + [f"del {name} {net} -exist" for net in removed]
+    ipset += [f"add {name} {net} -exist" for net in added]
+    # Deletes first, so a network replaced by one overlapping it never
+    # collides within the set.
+    nft = [header] + _nft_elements("delete", name, removed) + _nft_elements("add", name, added)
+    return {
+        "diff": "\n".join(plain) + "\n",
+        "ipset.diff": "\n".join(ipset) + "\n",
+        "nft.diff": "\n".join(nft) + "\n",
+    }
+
+
+def compile_list(output_file, lines, previous_lines, old_digest, new_digest, v6=False):
+    # {path: bytes} for one output list; previous_lines is what the output
+    # file held before this run (empty on the first run), unparsed lines and
+    # all.
+    name = Path(output_file).stem
+    nets = networks(lines)
+    added, removed = diff(previous_networks(previous_lines, v6), nets)
+    files = {
+        "ipset": ipset_script(name, nets, v6),
+        "nft": nft_script(name, nets, v6),
+        "ranges": range_table(nets, v6),
+        **diff_scripts(name, added, removed, old_digest, new_digest),
+    }
+    return {
+        path: data if isinstance(data, bytes) else data.encode("utf-8")
+        for path, data in zip(firewall_files(output_file), (files[suffix] for suffix in FORMATS))
+    }
+
+
+def firewall_files(output_file):
+    name = Path(output_file).stem
+    return [FIREWALL_DIR / f"{name}.{suffix}" for suffix in FORMATS]
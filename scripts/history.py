@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+# Columnar sighting history per feed, aggregated/<feed>/history.npz:
+#
+#   indicators  the feed's indicators, newline-joined; row i of the bitmap is
+#               indicator i
+#   days        day ordinal held by each bitmap column, 0 for a free column
+#   bitmap      (indicators x len(days) / 8) uint8, bit c of a row set when
+#               the indicator was in the snapshot of days[c]
+#
+# A new day takes the first free column, and the bitmap grows by a byte of
+# columns when none is left; forgetting a day clears its column for reuse
+# without moving the others. Columns are in no particular order, so any
+# number of stored days over any calendar span fits. aggregate_feeds.py keeps
+# the file in step with raw/ the way it keeps index.tsv, and rebuilds it by
+# replaying raw/ when the two disagree. Rows with no bits left are dropped on
+# save.
+#
+# The queries below unpack the bitmap into a (indicators x days) boolean
+# matrix in day order, a block of rows at a time:
+#
+#   churn        per stored day: listed, added and removed since the
+#                previous stored day
+#   persistence  histograms of days listed, spells (separate listings) per
+#                indicator, spell lengths and the gaps between spells; a gap
+#                of g days is bridged by any window longer than g
+#   overlap      indicators shared by every pair of feeds over the last
+#                `window` days
+#
+# Run as a script it prints a summary for every feed and can write the full
+# figures as JSON, which is what WINDOWS and PROMOTE_THRESHOLD are tuned
+# against.
+
+HISTORY_NAME = "history.npz"
+ROW_BLOCK = 1 << 16
+
+
+class History:
+    def __init__(self, indicators=None, days=None, bitmap=None):
+        self.indicators = list(indicators or [])
+        self.ids = {indicator: i for i, indicator in enumerate(self.indicators)}
+        self.days = np.zeros(0, dtype=np.int64) if days is None else days
+        self.bitmap = (
+            np.zeros((len(self.indicators), len(self.days) // 8), dtype=np.uint8)
+            if bitmap is None else bitmap
+        )
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if data["days"].shape != (data["bitmap"].shape[1] * 8,):
+                return None
+            text = data["indicators"].tobytes().decode("utf-8")
+            return cls(text.split("\n") if text else [], data["days"], data["bitmap"])
+
+    def save(self, path):
+        path = Path(path)
+        keep = self.bitmap.any(axis=1)
+        indicators = [i for i, kept in zip(self.indicators, keep.tolist()) if kept]
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(
+            tmp,
+            indicators=np.frombuffer("\n".join(indicators).encode("utf-8"), dtype=np.uint8),
+            days=self.days,
+            bitmap=self.bitmap[keep],
+        )
+        tmp.replace(path)
+
+    def stored_days(self):
+        return {int(d) for d in self.days if d}
+
+    def matches(self, raw_days, today):
+        # Same rule as WindowIndex.matches: built from exactly the raw
+        # snapshots on disk, with today's folded in or not.
+        today = today.toordinal()
+        stored = self.stored_days()
+        raw = {d.toordinal() for d in raw_days}
+        return all(d <= today for d in stored) and stored | {today} == raw | {today}
+
+    def _column(self, day):
+        # The day's own column if it is stored, else the first free one.
+        found = np.flatnonzero(self.days == day)
+        if not len(found):
+            found = np.flatnonzero(self.days == 0)
+        if len(found):
+            return int(found[0])
+        column = len(self.days)
+        self.days = np.concatenate([self.days, np.zeros(8, dtype=np.int64)])
+        grow = np.zeros((len(self.bitmap), 1), dtype=np.uint8)
+        self.bitmap = np.concatenate([self.bitmap, grow], axis=1)
+        return column
+
+    def _clear(self, column):
+        self.bitmap[:, column >> 3] &= np.uint8(~(1 << (column & 7)) & 0xFF)
+        self.days[column] = 0
+
+    def _rows(self, indicators):
+        ids = self.ids
+        new = [indicator for indicator in indicators if indicator not in ids]
+        for indicator in new:
+            ids[indicator] = len(self.indicators)
+            self.indicators.append(indicator)
+        if new:
+            grow = np.zeros((len(new), self.bitmap.shape[1]), dtype=np.uint8)
+            self.bitmap = np.concatenate([self.bitmap, grow])
+        return np.fromiter((ids[indicator] for indicator in indicators), dtype=np.int64,
+                           count=len(indicators))
+
+    def add_snapshot(self, day, indicators):
+        # Refolding a stored day replaces its column.
+        day = day.toordinal()
+        column = self._column(day)
+        self._clear(column)
+        rows = self._rows(list(indicators))
+        self.bitmap[rows, column >> 3] |= np.uint8(1 << (column & 7))
+        self.days[column] = day
+
+    def repeat_newest(self, day):
+        # A snapshot identical to the newest stored one.
+        day = day.toordinal()
+        newest = int(self.days.max(initial=0))
+        if not newest:
+            raise ValueError("no stored day to repeat")
+        if day <= newest:
+            raise ValueError(f"cannot repeat {date.fromordinal(newest)} as {date.fromordinal(day)}")
+        old, column = self._column(newest), self._column(day)
+        self._clear(column)
+        bits = (self.bitmap[:, old >> 3] >> np.uint8(old & 7)) & np.uint8(1)
+        self.bitmap[:, column >> 3] |= bits << np.uint8(column & 7)
+        self.days[column] = day
+
+    def forget_days(self, days):
+        for day in days:
+            for column in np.flatnonzero(self.days == day.toordinal()):
+                self._clear(int(column))
+
+    def matrix(self, rows=slice(None)):
+        # (day ordinals ascending, boolean matrix of those rows x days)
+        order = np.argsort(self.days)
+        order = order[self.days[order] > 0]
+        bits = np.unpackbits(self.bitmap[rows], axis=1, bitorder="little").astype(bool)
+        return self.days[order], bits[:, order]
+
+    def blocks(self):
+        for start in range(0, len(self.indicators), ROW_BLOCK):
+            yield self.matrix(slice(start, start + ROW_BLOCK))
+
+
+def build_history(store):
+    print(f"Rebuilding history from {store.raw_dir}")
+    history = History()
+    for day, indicators in store.replay():
+        history.add_snapshot(day, indicators)
+    return history
+
+
+def churn(history):
+    days = np.array(sorted(history.stored_days()), dtype=np.int64)
+    if not len(days):
+        return []
+    listed = np.zeros(len(days), dtype=np.int64)
+    added = np.zeros(len(days), dtype=np.int64)
+    removed = np.zeros(len(days), dtype=np.int64)
+    for _, present in history.blocks():
+        listed += present.sum(axis=0)
+        added[0] += present[:, 0].sum()
+        added[1:] += (present[:, 1:] & ~present[:, :-1]).sum(axis=0)
+        removed[1:] += (present[:, :-1] & ~present[:, 1:]).sum(axis=0)
+    return [
+        {"day": date.fromordinal(int(d)).isoformat(), "listed": int(n), "added": int(a),
+         "removed": int(r)}
+        for d, n, a, r in zip(days, listed, added, removed)
+    ]
+
+
+def persistence(history):
+    # Histograms as {value: indicators} (gaps and spell lengths in days).
+    days_listed, spells, spell_days, gaps = (np.zeros(1, dtype=np.int64) for _ in range(4))
+
+    def add(hist, values):
+        counts = np.bincount(values)
+        if len(counts) > len(hist):
+            hist = np.concatenate([hist, np.zeros(len(counts) - len(hist), dtype=np.int64)])
+        hist[:len(counts)] += counts
+        return hist
+
+    for days, present in history.blocks():
+        if not present.shape[1]:
+            continue
+        days_listed = add(days_listed, present.sum(axis=1))
+        starts = present[:, 0].astype(np.int64) + (present[:, 1:] & ~present[:, :-1]).sum(axis=1)
+        spells = add(spells, starts)
+
+        # Consecutive sightings of the same indicator, in row-major order.
+        row, col = np.nonzero(present)
+        if not len(col):
+            continue
+        same = row[1:] == row[:-1]
+        apart = days[col[1:]] - days[col[:-1]]
+        broken = ~same | (col[1:] != col[:-1] + 1)
+        gaps = add(gaps, apart[same & broken] - 1)
+        # Spell lengths in calendar days, first to last sighting.
+        first = np.r_[0, np.flatnonzero(broken) + 1]
+        last = np.r_[first[1:] - 1, len(col) - 1]
+        spell_days = add(spell_days, days[col[last]] - days[col[first]] + 1)
+
+    def as_dict(hist):
+        return {int(v): int(n) for v, n in enumerate(hist) if n}
+
+    return {
+        "days_listed": as_dict(days_listed),
+        "spells": as_dict(spells),
+        "spell_days": as_dict(spell_days),
+        "gap_days": as_dict(gaps),
+    }
+
+
+def listed_within(history, window, today=None):
+    # Indicators seen in the last `window` stored-day span ending at `today`
+    # (default: the newest stored day).
+    today = int(history.days.max(initial=0)) if today is None else today.toordinal()
+    cutoff = today - (window - 1)
+    out = []
+    for start, (days, present) in zip(range(0, len(history.indicators), ROW_BLOCK),
+                                      history.blocks()):
+        recent = present[:, (days >= cutoff) & (days <= today)].any(axis=1)
+        out += [history.indicators[start + i] for i in np.flatnonzero(recent)]
+    return out
+
+
+def overlap(histories, window, today=None):
+    # {feed: {feed: shared indicators}} over the last `window` days. Each
+    # indicator gets a bitmask of the feeds listing it; a pair's overlap is
+    # a count over the masks holding the first feed's bit.
+    names = list(histories)
+    if len(names) > 64:
+        raise ValueError("overlap covers at most 64 feeds")
+    ids = {}
+    masks = np.zeros(0, dtype=np.uint64)
+    for bit, name in enumerate(names):
+        listed = listed_within(histories[name], window, today)
+        rows = np.fromiter((ids.setdefault(i, len(ids)) for i in listed), dtype=np.int64,
+                           count=len(listed))
+        if len(ids) > len(masks):
+            masks = np.concatenate([masks, np.zeros(len(ids) - len(masks), dtype=np.uint64)])
+        masks[rows] |= np.uint64(1 << bit)
+
+    out = {}
+    for i, name in enumerate(names):
+        rows = masks[(masks >> np.uint64(i)) & np.uint64(1) == 1]
+        out[name] = {
+            other: int(((rows >> np.uint64(j)) & np.uint64(1)).sum())
+            for j, other in enumerate(names)
+        }
+    return out
+
+
+def load_histories(feeds):
+    from aggregate_feeds import BASE_DIR
+
+    histories = {}
+    for feed in feeds:
+        history = History.load(BASE_DIR / feed / HISTORY_NAME)
+        if history is None:
+            print(f"No history for {feed}")
+            continue
+        histories[feed] = history
+    return histories
+
+
+def _share(hist, predicate):
+    total = sum(hist.values())
+    return sum(n for v, n in hist.items() if predicate(v)) / total if total else 0.0
+
+
+def main():
+    from aggregate_feeds import SOURCES, WINDOWS
+
+    parser = argparse.ArgumentParser(description="Churn, persistence and overlap of the feeds")
+    parser.add_argument("feeds", nargs="*", help="default: every feed in aggregate_feeds.SOURCES")
+    parser.add_argument("--window", type=int, default=90,
+                        help="days of history for the overlap matrix")
+    parser.add_argument("--json", type=Path, help="write every figure here")
+    args = parser.parse_args()
+
+    histories = load_histories(args.feeds or [source["name"] for source in SOURCES])
+    report = {"feeds": {}, "overlap": overlap(histories, args.window)}
+    for name, history in histories.items():
+        daily = churn(history)
+        stats = persistence(history)
+        report["feeds"][name] = {"churn": daily, "persistence": stats}
+
+        changes = daily[1:]
+        listed = np.mean([d["listed"] for d in daily]) if daily else 0
+        moved = np.mean([d["added"] + d["removed"] for d in changes]) if changes else 0
+        bridged = ", ".join(
+            f"{label} {_share(stats['gap_days'], lambda g, n=span: g < n):.0%}"
+            for label, span in WINDOWS.items()
+        )
+        print(f"{name}: {len(daily)} days, {listed:,.0f} listed/day, "
+              f"churn {moved / listed if listed else 0:.1%}/day, "
+              f"listed 7+ days {_share(stats['days_listed'], lambda d: d >= 7):.0%}, "
+              f"gaps bridged by {bridged or '-'}")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+
+import heapq
+import ipaddress
+import socket
+from array import array
+from itertools import islice, repeat
+
+import numpy as np
+
+from cidr_collapse import PrefixTrie, format_cidr
+
+# Integer-packed counting engine for aggregate_ips.py.
+#
+# IPv4 addresses are packed straight into big-endian uint32 as they are read
+# and counted with NumPy: the /24 and /16 rollups are shifts plus grouped
+# reductions over the sorted unique addresses, so no ipaddress objects are
+# created per address. IPv6 addresses are packed the same way, 16 bytes each,
+# and rolled up separately to /64, /48 and /32 for their own output list.
+#
+# IPv4 CIDRs (et_block, spamhaus_drop, the firehol netsets) are kept as
+# ranges of /24s. Overlapping ranges are merged with a sorted sweep into
+# weighted segments, and only those segments are spread over the /24 table,
+# so even a /8 costs 65,536 table rows rather than 16M addresses. Each listed
+# CIDR counts RANGE_WEIGHT hits for every /24 it touches. Tagged ranges
+# (consensus scoring) are scored per segment instead, from the tags of the
+# ranges covering it, so a group of correlated sources listing the same
+# range casts one vote just as it does for an address.
+#
+# Lines may carry a weight (recency scores from scoring.py); a plain line
+# counts 1. Per-address weights are only stored once a weighted line has
+# been added, so unweighted runs keep the 4-bytes-per-address footprint.
+#
+# Ranking ties are broken by the stream position where a network was first
+# seen. That is the insertion order the Counter-based implementation relied
+# on, so both engines emit identical lists for plain, unweighted IPv4 lines
+# in prefix mode. The "objects" engine in aggregate_ips.py has none of the
+# rest: it skips CIDR lines and IPv6 addresses, and has no weights, CIDR
+# output or consensus scoring.
+
+
+RANGE_WEIGHT = 1
+
+
+class PackedCounter:
+    def __init__(self):
+        self.v4 = bytearray()
+        # Number of IPv4 entries before each non-IPv4 entry, in stream order.
+        self.marks = array("q")
+        # Weight of each IPv4 entry; None while every weight is 1.
+        self.weights = None
+        # IPv6 addresses packed 16 bytes each, with their stream positions
+        # and weights.
+        self.v6 = bytearray()
+        self.v6_positions = array("q")
+        self.v6_weights = array("d")
+        # (stream position, first /24, last /24, weight)
+        self.ranges = []
+        # Provenance tags (provenance.py) of each IPv4, IPv6 and range entry;
+        # None unless the lines were added with tags.
+        self.tags = None
+        self.v6_tags = None
+        self.range_tags = None
+        # Lines that were neither an address nor an IPv4 CIDR.
+        self.rejected = 0
+
+    def add_lines(self, lines, weights=None, tags=None):
+        if tags is not None or self.tags is not None:
+            self._add_tagged(lines, tags)
+            return
+        if weights is not None or self.weights is not None:
+            self._add_weighted(lines, repeat(1) if weights is None else weights)
+            return
+
+        v4 = self.v4
+        pton = socket.inet_pton
+        af_inet = socket.AF_INET
+        for line in lines:
+            try:
+                v4 += pton(af_inet, line)
+            except (OSError, ValueError):
+                self._add_other(line)
+
+    def _add_weighted(self, lines, weights):
+        if self.weights is None:
+            self.weights = array("d", [1.0]) * (len(self.v4) // 4)
+        v4 = self.v4
+        v4_weights = self.weights
+        pton = socket.inet_pton
+        af_inet = socket.AF_INET
+        for line, weight in zip(lines, weights):
+            try:
+                v4 += pton(af_inet, line)
+            except (OSError, ValueError):
+                self._add_other(line, weight)
+                continue
+            v4_weights.append(weight)
+
+    def _add_tagged(self, lines, tags):
+        # Every entry of a tagged counter has a tag, ranges included.
+        if tags is None or (self.tags is None and len(self)):
+            raise ValueError("cannot mix tagged and untagged lines")
+        if self.weights is not None:
+            raise ValueError("tagged lines carry no weights")
+        if self.tags is None:
+            self.tags, self.v6_tags, self.range_tags = array("H"), array("H"), array("H")
+        v4 = self.v4
+        v4_tags = self.tags
+        pton = socket.inet_pton
+        af_inet = socket.AF_INET
+        for line, tag in zip(lines, tags):
+            try:
+                v4 += pton(af_inet, line)
+            except (OSError, ValueError):
+                self._add_other(line, 1, tag)
+                continue
+            v4_tags.append(tag)
+
+    def merge(self, other):
+        # Append another counter's entries as if its lines had followed ours.
+        if (self.tags is None) != (other.tags is None) and len(self) and len(other):
+            raise ValueError("cannot merge tagged and untagged counts")
+        if self.tags is None and other.tags is not None:
+            self.tags, self.v6_tags, self.range_tags = array("H"), array("H"), array("H")
+        if other.tags is not None:
+            self.tags += other.tags
+            self.v6_tags += other.v6_tags
+            self.range_tags += other.range_tags
+        v4_seen = len(self.v4) // 4
+        offset = v4_seen + len(self.marks)
+        if self.weights is not None or other.weights is not None:
+            if self.weights is None:
+                self.weights = array("d", [1.0]) * v4_seen
+            self.weights += other.weights or array("d", [1.0]) * (len(other.v4) // 4)
+        self.v4 += other.v4
+        self.marks.extend(mark + v4_seen for mark in other.marks)
+        self.v6 += other.v6
+        self.v6_positions.extend(pos + offset for pos in other.v6_positions)
+        self.v6_weights += other.v6_weights
+        self.ranges += [
+            (pos + offset, first, last, weight) for pos, first, last, weight in other.ranges
+        ]
+        self.rejected += other.rejected
+
+    def _add_other(self, line, weight=1, tag=None):
+        if "/" in line:
+            self._add_cidr(line, weight, tag)
+            return
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, line)
+        except (OSError, ValueError):
+            packed = None
+        if packed is None:
+            try:
+                ip = ipaddress.ip_address(line)
+            except ValueError:
+                self.rejected += 1
+                return
+            packed = ip.packed
+        if len(packed) == 4:
+            self.v4 += packed
+            if self.weights is not None:
+                self.weights.append(weight)
+            if self.tags is not None:
+                self.tags.append(tag)
+            return
+        self.v6_positions.append(self._next_position())
+        self.v6 += packed
+        self.v6_weights.append(weight)
+        if self.v6_tags is not None:
+            self.v6_tags.append(tag)
+
+    def _add_cidr(self, line, weight, tag=None):
+        addr, _, prefix = line.partition("/")
+        try:
+            start = int.from_bytes(socket.inet_pton(socket.AF_INET, addr), "big")
+        except (OSError, ValueError):
+            self.rejected += 1
+            return
+        if not prefix.isdigit() or int(prefix) > 32:
+            self.rejected += 1
+            return
+        size = 1 << (32 - int(prefix))
+        start &= ~(size - 1)
+        self.ranges.append((self._next_position(), start >> 8, (start + size - 1) >> 8, weight))
+        if self.range_tags is not None:
+            self.range_tags.append(tag)
+
+    def _next_position(self):
+        v4_seen = len(self.v4) // 4
+        position = v4_seen + len(self.marks)
+        self.marks.append(v4_seen)
+        return position
+
+    def __len__(self):
+        return len(self.v4) // 4 + len(self.marks)
+
+    @property
+    def v6_count(self):
+        return len(self.v6_positions)
+
+
+class Rollup:
+    # Per-network tables shared by every output profile. A tagged counter
+    # needs `consensus` (provenance.Consensus), which scores each address
+    # from the tags of all its entries; that score replaces the hit count.
+    # With `exclusions` (exclusions.Exclusions) no network that contains an
+    # allowed address is listed or promoted.
+    def __init__(self, counter, consensus=None, exclusions=None):
+        if counter.tags is not None and consensus is None:
+            raise ValueError("tagged counts need a consensus score")
+        v4 = np.frombuffer(counter.v4, dtype=">u4").astype(np.uint32)
+        marks = np.frombuffer(counter.marks, dtype=np.int64)
+
+        # Sort once; the stable order gives each address's first occurrence.
+        order = np.argsort(v4, kind="stable")
+        v4 = v4[order]
+        starts = _group_starts(v4)
+        ips = v4[starts]
+        if counter.tags is not None:
+            counts = consensus(np.frombuffer(counter.tags, dtype=np.uint16)[order], starts)
+        elif counter.weights is None:
+            counts = np.diff(np.append(starts, len(v4)))
+        else:
+            weights = np.frombuffer(counter.weights, dtype=np.float64)[order]
+            counts = np.add.reduceat(weights, starts) if len(starts) else weights
+            del weights
+        first_idx = order[starts]
+        if counter.tags is not None:
+            # Addresses listed only outside the consensus window drop out.
+            keep = counts > 0
+            ips, counts, first_idx = ips[keep], counts[keep], first_idx[keep]
+        del v4, order, starts
+
+        # Global stream position, counting the non-IPv4 entries in between.
+        ip_first = first_idx
+        if len(marks):
+            ip_first = first_idx + np.searchsorted(marks, first_idx, side="right")
+
+        keys24 = ips >> np.uint32(8)
+        starts = _group_starts(keys24)
+        self.net24 = keys24[starts]
+        self.count24 = np.add.reduceat(counts, starts) if len(starts) else counts[:0]
+        self.first24 = np.minimum.reduceat(ip_first, starts) if len(starts) else ip_first[:0]
+
+        if counter.ranges and counter.range_tags is not None:
+            self._merge_ranges(*_tagged_segments(counter.ranges, counter.range_tags, consensus))
+        elif counter.ranges:
+            self._merge_ranges(*_sweep(counter.ranges))
+        self.exclusions = exclusions
+        if exclusions is not None:
+            keep = ~exclusions.v4_excluded(self.net24, 24)
+            self.net24, self.count24, self.first24 = (
+                self.net24[keep], self.count24[keep], self.first24[keep]
+            )
+
+        keys16 = self.net24 >> np.uint32(8)
+        starts = _group_starts(keys16)
+        self.net16 = keys16[starts]
+        self.size16 = np.diff(np.append(starts, len(keys16)))
+        self.first16 = (
+            np.minimum.reduceat(self.first24, starts) if len(starts) else self.first24[:0]
+        )
+        self.open16 = self._open(self.net16, 16)
+
+        self._rollup_v6(counter, consensus)
+        self._trie = None
+
+    def _merge_ranges(self, seg_start, seg_end, seg_weight, seg_first):
+        # Spread each segment over the /24s it covers.
+        lengths = seg_end - seg_start
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        keys = (np.repeat(seg_start, lengths) + offsets).astype(np.uint32)
+
+        keys = np.concatenate([self.net24, keys])
+        counts = np.concatenate([self.count24, np.repeat(seg_weight, lengths)])
+        firsts = np.concatenate([self.first24, np.repeat(seg_first, lengths)])
+
+        order = np.argsort(keys, kind="stable")
+        keys, counts, firsts = keys[order], counts[order], firsts[order]
+        starts = _group_starts(keys)
+        self.net24 = keys[starts]
+        self.count24 = np.add.reduceat(counts, starts)
+        self.first24 = np.minimum.reduceat(firsts, starts)
+
+    def _rollup_v6(self, counter, consensus):
+        # Every IPv6 level is a prefix of the upper 64 bits, so the /64 keys
+        # are all that is kept: hits per /64, then distinct /64s per /48 and
+        # distinct /48s per /32.
+        packed = np.frombuffer(counter.v6, dtype=">u8")
+        upper = packed[0::2].astype(np.uint64)
+        positions = np.frombuffer(counter.v6_positions, dtype=np.int64)
+
+        if counter.v6_tags is not None:
+            # Scored per address first, so the addresses are told apart.
+            lower = packed[1::2].astype(np.uint64)
+            order = np.lexsort((lower, upper))
+            upper, lower = upper[order], lower[order]
+            starts = np.flatnonzero(
+                np.r_[True, (upper[1:] != upper[:-1]) | (lower[1:] != lower[:-1])]
+            ) if len(upper) else np.zeros(0, dtype=np.int64)
+            weights = consensus(np.frombuffer(counter.v6_tags, dtype=np.uint16)[order], starts)
+            positions = _reduce(np.minimum, positions[order], starts)
+            keep = weights > 0
+            upper, weights, positions = upper[starts][keep], weights[keep], positions[keep]
+        else:
+            order = np.argsort(upper, kind="stable")
+            upper = upper[order]
+            positions = positions[order]
+            weights = np.frombuffer(counter.v6_weights, dtype=np.float64)[order]
+
+        starts = _group_starts(upper)
+        self.v6_net64 = upper[starts]
+        self.v6_count64 = _reduce(np.add, weights, starts)
+        self.v6_first64 = _reduce(np.minimum, positions, starts)
+        if self.exclusions is not None:
+            keep = ~self.exclusions.v6_excluded(self.v6_net64, 64)
+            self.v6_net64, self.v6_count64, self.v6_first64 = (
+                self.v6_net64[keep], self.v6_count64[keep], self.v6_first64[keep]
+            )
+
+        keys48 = self.v6_net64 >> np.uint64(16)
+        starts = _group_starts(keys48)
+        self.v6_net48 = keys48[starts]
+        self.v6_size48 = np.diff(np.append(starts, len(keys48)))
+        self.v6_first48 = _reduce(np.minimum, self.v6_first64, starts)
+
+        keys32 = self.v6_net48 >> np.uint64(16)
+        starts = _group_starts(keys32)
+        self.v6_net32 = keys32[starts]
+        self.v6_size32 = np.diff(np.append(starts, len(keys32)))
+        self.v6_first32 = _reduce(np.minimum, self.v6_first48, starts)
+        self.v6_open48 = self._open(self.v6_net48, 48, v6=True)
+        self.v6_open32 = self._open(self.v6_net32, 32, v6=True)
+
+    def _open(self, nets, prefix, v6=False):
+        # Which networks may be promoted whole: those without an allowed address.
+        if self.exclusions is None:
+            return np.ones(len(nets), dtype=bool)
+        if v6:
+            return ~self.exclusions.v6_excluded(nets, prefix)
+        return ~self.exclusions.v4_excluded(nets, prefix)
+
+    def lines(self, threshold, max_lines):
+        # IPv4 only: promoted "a.b." /16s, then "a.b.c." /24s.
+        promoted = (self.size16 >= threshold) & self.open16
+        sorted_16s = _ranked(self.net16[promoted], self.size16[promoted], self.first16[promoted],
+                             _v4_16, max_lines)
+
+        keep = ~np.isin(self.net24 >> np.uint32(8), self.net16[promoted])
+        sorted_24s = _ranked(self.net24[keep], self.count24[keep], self.first24[keep], _v4_24,
+                             max_lines)
+
+        lines = [fmt(net) for _, _, net, fmt in islice(sorted_16s, max_lines)]
+        lines += [fmt(net) for _, _, net, fmt in islice(sorted_24s, max_lines - len(lines))]
+        return lines
+
+    def v6_lines(self, thresholds, max_lines):
+        # IPv6 CIDRs: /32s holding at least thresholds[0] listed /48s, then
+        # /48s holding at least thresholds[1] listed /64s, then /64s by hits.
+        promote32, promote48 = thresholds
+        shift = np.uint64(16)
+
+        promoted32 = (self.v6_size32 >= promote32) & self.v6_open32
+        nets32 = self.v6_net32[promoted32]
+        promoted48 = (
+            (self.v6_size48 >= promote48) & self.v6_open48
+            & ~np.isin(self.v6_net48 >> shift, nets32)
+        )
+        nets48 = self.v6_net48[promoted48]
+        keep64 = ~np.isin(self.v6_net64 >> shift, nets48) & ~np.isin(
+            self.v6_net64 >> (shift + shift), nets32
+        )
+
+        levels = [
+            _ranked(nets32, self.v6_size32[promoted32], self.v6_first32[promoted32], _v6_32,
+                    max_lines),
+            _ranked(nets48, self.v6_size48[promoted48], self.v6_first48[promoted48], _v6_48,
+                    max_lines),
+            _ranked(self.v6_net64[keep64], self.v6_count64[keep64], self.v6_first64[keep64],
+                    _v6_64, max_lines),
+        ]
+        lines = []
+        for ranked in levels:
+            lines += [fmt(net) for _, _, net, fmt in islice(ranked, max_lines - len(lines))]
+        return lines
+
+    def cidr_lines(self, threshold, max_lines):
+        # IPv4 only: variable-length CIDRs chosen by cidr_collapse.PrefixTrie.
+        if self._trie is None:
+            excluded = self.exclusions.v4_excluded if self.exclusions is not None else None
+            self._trie = PrefixTrie(self.net24, self.count24, excluded=excluded)
+        return [
+            format_cidr(network, prefix)
+            for network, prefix, _ in self._trie.select(threshold, max_lines)
+        ]
+
+
+def _sweep(ranges):
+    # Merge (position, first /24, last /24, weight) ranges into disjoint
+    # segments [start, end) carrying the summed weight of every range
+    # covering them and the earliest position among those ranges.
+    ranges = sorted(ranges, key=lambda r: r[1])
+    ends = {}
+    for _, first, last, weight in ranges:
+        count, total = ends.get(last + 1, (0, 0))
+        ends[last + 1] = (count + 1, total + weight)
+    bounds = sorted({r[1] for r in ranges} | set(ends))
+
+    out_start, out_end, out_weight, out_first = [], [], [], []
+    active = []  # heap of (position, end)
+    depth = total = 0
+    i = 0
+    for lo, hi in zip(bounds, bounds[1:]):
+        ended, ended_weight = ends.get(lo, (0, 0))
+        depth -= ended
+        total -= ended_weight
+        while i < len(ranges) and ranges[i][1] == lo:
+            position, first, last, weight = ranges[i]
+            heapq.heappush(active, (position, last + 1))
+            depth += 1
+            total += weight
+            i += 1
+        while active and active[0][1] <= lo:
+            heapq.heappop(active)
+        if depth:
+            out_start.append(lo)
+            out_end.append(hi)
+            out_weight.append(total * RANGE_WEIGHT)
+            out_first.append(active[0][0])
+
+    return (
+        np.array(out_start, dtype=np.int64),
+        np.array(out_end, dtype=np.int64),
+        np.array(out_weight),
+        np.array(out_first, dtype=np.int64),
+    )
+
+
+def _tagged_segments(ranges, tags, consensus):
+    # Same segments as _sweep, but each one's weight is the consensus score
+    # of the tags of every range covering it. Segments scored 0 (listed only
+    # outside the consensus window) are left out.
+    positions, firsts, lasts, _ = (np.array(column, dtype=np.int64) for column in zip(*ranges))
+    ends = lasts + 1
+    bounds = np.unique(np.concatenate([firsts, ends]))
+    lo = np.searchsorted(bounds, firsts)
+    spans = np.searchsorted(bounds, ends) - lo
+    # Every (segment, range covering it) pair, grouped by segment.
+    segments = np.repeat(lo, spans) + (
+        np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans)
+    )
+    order = np.argsort(segments, kind="stable")
+    segments = segments[order]
+    starts = _group_starts(segments)
+    scores = consensus(np.repeat(np.frombuffer(tags, dtype=np.uint16), spans)[order], starts)
+    seg_first = _reduce(np.minimum, np.repeat(positions, spans)[order], starts)
+    segments = segments[starts]
+    keep = scores > 0
+    return (
+        bounds[segments][keep],
+        bounds[segments + 1][keep],
+        scores[keep] * RANGE_WEIGHT,
+        seg_first[keep],
+    )
+
+
+def _reduce(ufunc, values, starts):
+    return ufunc.reduceat(values, starts) if len(starts) else values[:0]
+
+
+def _group_starts(sorted_keys):
+    if not len(sorted_keys):
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+def _ranked(nets, counts, firsts, fmt, limit=None, chunk=4096):
+    # Highest count first, earliest first sighting breaks ties. Only the top
+    # `limit` are sorted, and they are converted to Python ints a chunk at a
+    # time since callers stop after max_lines.
+    if limit is not None and len(counts) > limit:
+        top = _top(counts, firsts, limit)
+        nets, counts, firsts = nets[top], counts[top], firsts[top]
+    order = np.lexsort((firsts, -counts))
+    for i in range(0, len(order), chunk):
+        part = order[i:i + chunk]
+        for net, count, first in zip(nets[part].tolist(), counts[part].tolist(),
+                                     firsts[part].tolist()):
+            yield (-count, first, net, fmt)
+
+
+def _top(counts, firsts, limit):
+    # Indexes of the `limit` entries a full _ranked sort would put first, in
+    # ascending order: a partial selection on the counts, then on first
+    # sighting among the entries tied at the cut-off count, then the lowest
+    # index (the stable sort's order) among those tied on both.
+    cutoff = np.partition(counts, len(counts) - limit)[len(counts) - limit]
+    above = np.flatnonzero(counts > cutoff)
+    tied = np.flatnonzero(counts == cutoff)
+    need = limit - len(above)
+    if need < len(tied):
+        tied_firsts = firsts[tied]
+        first_cutoff = np.partition(tied_firsts, need - 1)[need - 1]
+        before = tied[tied_firsts < first_cutoff]
+        at = tied[tied_firsts == first_cutoff][:need - len(before)]
+        tied = np.concatenate([before, at])
+    return np.sort(np.concatenate([above, tied]))
+
+
+def _v4_16(net):
+    return f"{net >> 8}.{net & 0xFF}."
+
+
+def _v4_24(net):
+    return f"{net >> 16}.{(net >> 8) & 0xFF}.{net & 0xFF}."
+
+
+def _v6_32(net):
+    return f"{ipaddress.IPv6Address(net << 96)}/32"
+
+
+def _v6_48(net):
+    return f"{ipaddress.IPv6Address(net << 80)}/48"
+
+
+def _v6_64(net):
+    return f"{ipaddress.IPv6Address(net << 64)}/64"
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+import argparse
+import ipaddress
+import json
+import re
+import socket
+import sys
+from bisect import bisect_right
+from pathlib import Path
+
+import numpy as np
+
+from aggregate_feeds import BASE_DIR, WINDOWS
+from fetching import read_lines
+
+# Membership lookups over the published lists, compiled into one index file.
+#
+# Every IP list entry (host, CIDR, or the "a.b." / "a.b.c." prefixes in
+# output/) becomes a range of addresses. The range bounds cut the address
+# space into elementary intervals; each interval carries the id of the set
+# of lists covering it. A lookup is then a binary search over the sorted
+# bounds (np.searchsorted for a batch), whatever the number of lists. Sets
+# of lists are interned, and a feed listed in several windows is reported
+# only in its smallest window ("tor_exits:7d").
+#
+# Domain lists are a dict from domain to list set. A query also checks each
+# parent domain, so a listed example.com matches www.example.com.
+#
+#   python scripts/lookup.py build
+#   python scripts/lookup.py query 1.2.3.4 example.com
+#   python scripts/lookup.py annotate access.log > annotated.log
+
+INDEX_FILE = Path("output/lookup.npz")
+
+IP_LISTS = {
+    "aggregated": Path("output/aggregated.txt"),
+    "aggregated_205_80": Path("output/aggregated_205_80.txt"),
+    "aggregated_cidr": Path("output/aggregated_cidr.txt"),
+    "aggregated_v6": Path("output/aggregated_v6.txt"),
+}
+DOMAIN_LISTS = {
+    "hagezi_minus_tranco": Path("combined-hagezi-minus-tranco.txt"),
+}
+
+ANNOTATE_BATCH = 1 << 16
+IPV4 = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
+
+
+def list_files():
+    # (name, window or None, path) for every IP list present in the tree.
+    for name, path in IP_LISTS.items():
+        if path.is_file():
+            yield name, None, path
+    if BASE_DIR.is_dir():
+        for feed_dir in sorted(p for p in BASE_DIR.iterdir() if p.is_dir()):
+            for window in WINDOWS:
+                path = feed_dir / f"{window}.txt"
+                if path.is_file():
+                    yield feed_dir.name, window, path
+
+
+def entry_range(line):
+    # (version, first, last) for a host, CIDR or published prefix; None if
+    # the line is none of these.
+    if line.endswith("."):
+        return _prefix_range(line[:-1])
+    try:
+        ip = int.from_bytes(socket.inet_pton(socket.AF_INET, line), "big")
+        return 4, ip, ip
+    except (OSError, ValueError):
+        pass
+    try:
+        network = ipaddress.ip_network(line, strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+
+def _prefix_range(prefix):
+    # "a.b" is a /16 and "a.b.c" a /24.
+    octets = prefix.split(".")
+    if len(octets) not in (2, 3) or not all(o.isdigit() and int(o) < 256 for o in octets):
+        return None
+    first = 0
+    for octet in octets:
+        first = (first << 8) | int(octet)
+    first <<= 8 * (4 - len(octets))
+    return 4, first, first | ((1 << (8 * (4 - len(octets)))) - 1)
+
+
+def _intervals(first, last, ids, list_count, bound_count):
+    # first/last: positions into the sorted bounds (last exclusive). Returns
+    # (set id per bound, list of sets as sorted id tuples); -1 = no list.
+    set_ids = np.full(bound_count, -1, dtype=np.int32)
+    if not len(first):
+        return set_ids, []
+    lengths = last - first
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cells = np.repeat(first, lengths) + offsets
+    cell_ids = np.repeat(ids, lengths)
+    del offsets
+
+    order = np.lexsort((cell_ids, cells))
+    cells, cell_ids = cells[order], cell_ids[order]
+    keep = np.r_[True, (cells[1:] != cells[:-1]) | (cell_ids[1:] != cell_ids[:-1])]
+    cells, cell_ids = cells[keep], cell_ids[keep]
+
+    # Sets are told apart by the XOR of random per-list keys, so only one
+    # Python tuple is built per distinct set.
+    keys = np.random.default_rng(0).integers(1, 2**63, list_count, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    _, first_seen, inverse = np.unique(
+        np.bitwise_xor.reduceat(keys[cell_ids], starts), return_index=True, return_inverse=True
+    )
+    ends = np.append(starts[1:], len(cells))
+    sets = [tuple(cell_ids[starts[i]:ends[i]].tolist()) for i in first_seen]
+
+    set_ids[cells[starts]] = inverse.reshape(-1)
+    return set_ids, sets
+
+
+class LookupIndex:
+    # labels[0] is "" (no match); the *_sets arrays and the domain dict hold
+    # indexes into labels.
+    def __init__(self, labels, v4_bounds, v4_sets, v6_bounds, v6_sets, domains):
+        self.labels = labels
+        self.v4_bounds = v4_bounds
+        self.v4_sets = v4_sets
+        self.v6_bounds = v6_bounds
+        self.v6_sets = v6_sets
+        self.domains = domains
+
+    @classmethod
+    def build(cls, files=None, domain_lists=DOMAIN_LISTS):
+        files = list(list_files() if files is None else files)
+        lists = [(name, window) for name, window, _ in files]
+        v4, v6 = ([], [], []), ([], [], [])
+        for list_id, (_, _, path) in enumerate(files):
+            for line in read_lines(path):
+                entry = entry_range(line)
+                if entry is not None:
+                    version, first, last = entry
+                    target = v4 if version == 4 else v6
+                    target[0].append(first)
+                    target[1].append(last)
+                    target[2].append(list_id)
+
+        # IPv4 in NumPy; the few IPv6 entries are ranked in Python first.
+        starts, lasts, ids = (np.array(a, dtype=np.int64) for a in v4)
+        v4_bounds = np.unique(np.concatenate([starts, lasts + 1]))
+        v4_sets, v4_groups = _intervals(
+            np.searchsorted(v4_bounds, starts), np.searchsorted(v4_bounds, lasts + 1),
+            ids, len(lists), len(v4_bounds),
+        )
+        v6_bounds = sorted(set(v6[0]) | {last + 1 for last in v6[1]})
+        rank = {bound: i for i, bound in enumerate(v6_bounds)}
+        v6_sets, v6_groups = _intervals(
+            np.array([rank[b] for b in v6[0]], dtype=np.int64),
+            np.array([rank[b + 1] for b in v6[1]], dtype=np.int64),
+            np.array(v6[2], dtype=np.int64), len(lists), len(v6_bounds),
+        )
+
+        labels = [""]
+        interned = {"": 0}
+
+        def intern(label):
+            if label not in interned:
+                interned[label] = len(labels)
+                labels.append(label)
+            return interned[label]
+
+        # Set id -1 picks the trailing 0, the empty label.
+        v4_map = np.array([intern(_label(lists, g)) for g in v4_groups] + [0], dtype=np.int32)
+        v6_map = np.array([intern(_label(lists, g)) for g in v6_groups] + [0], dtype=np.int32)
+
+        domains = {}
+        for name, path in domain_lists.items():
+            if not path.is_file():
+                continue
+            for domain in read_lines(path):
+                names = domains.setdefault(domain.lower(), [])
+                if name not in names:
+                    names.append(name)
+        domains = {domain: intern(",".join(names)) for domain, names in domains.items()}
+
+        return cls(labels, v4_bounds, v4_map[v4_sets], v6_bounds,
+                   v6_map[v6_sets], domains)
+
+    def save(self, path=INDEX_FILE):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        domains = list(self.domains)
+        v6 = np.array(self.v6_bounds, dtype=object)
+        np.savez(
+            path,
+            labels=np.array(json.dumps(self.labels)),
+            v4_bounds=self.v4_bounds,
+            v4_sets=self.v4_sets,
+            v6_hi=(v6 >> 64).astype(np.uint64) if len(v6) else np.zeros(0, np.uint64),
+            v6_lo=(v6 & (2**64 - 1)).astype(np.uint64) if len(v6) else np.zeros(0, np.uint64),
+            v6_sets=self.v6_sets,
+            domains=np.frombuffer("\n".join(domains).encode(), dtype=np.uint8),
+            domain_labels=np.array([self.domains[d] for d in domains], dtype=np.int32),
+        )
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with np.load(path) as data:
+            text = data["domains"].tobytes().decode()
+            domains = dict(zip(text.split("\n"), data["domain_labels"].tolist())) if text else {}
+            v6_bounds = [
+                (hi << 64) | lo for hi, lo in zip(data["v6_hi"].tolist(), data["v6_lo"].tolist())
+            ]
+            return cls(
+                json.loads(str(data["labels"])),
+                data["v4_bounds"],
+                data["v4_sets"],
+                v6_bounds,
+                data["v6_sets"],
+                domains,
+            )
+
+    def _v4_label_ids(self, ints):
+        positions = np.searchsorted(self.v4_bounds, ints, side="right") - 1
+        ids = np.zeros(len(ints), dtype=np.int32)
+        inside = positions >= 0
+        ids[inside] = self.v4_sets[positions[inside]]
+        return ids
+
+    def lookup_ip(self, ip):
+        # Comma-separated matches ("" for none); ValueError for a bad address.
+        try:
+            packed = socket.inet_pton(socket.AF_INET, ip)
+        except (OSError, ValueError):
+            packed = None
+        if packed is not None:
+            position = int(self.v4_bounds.searchsorted(int.from_bytes(packed, "big"), "right")) - 1
+            return self.labels[self.v4_sets[position]] if position >= 0 else ""
+        ip = ipaddress.ip_address(ip)
+        position = bisect_right(self.v6_bounds, int(ip)) - 1
+        return self.labels[self.v6_sets[position]] if position >= 0 else ""
+
+    def lookup_ips(self, ips):
+        # Batch form of lookup_ip; invalid addresses match nothing.
+        ips = list(ips)
+        packed = bytearray()
+        v4_at = []
+        others = {}
+        pton = socket.inet_pton
+        for i, ip in enumerate(ips):
+            try:
+                packed += pton(socket.AF_INET, ip)
+                v4_at.append(i)
+            except (OSError, ValueError):
+                others[i] = ip
+        out = [""] * len(ips)
+        if v4_at:
+            ints = np.frombuffer(packed, dtype=">u4").astype(np.int64)
+            labels = self.labels
+            for i, label_id in zip(v4_at, self._v4_label_ids(ints).tolist()):
+                out[i] = labels[label_id]
+        for i, ip in others.items():
+            try:
+                out[i] = self.lookup_ip(ip)
+            except ValueError:
+                pass
+        return out
+
+    def lookup_domain(self, domain):
+        # Matches for the domain or, failing that, its closest listed parent.
+        domain = domain.lower().rstrip(".")
+        while True:
+            label_id = self.domains.get(domain)
+            if label_id is not None:
+                return self.labels[label_id]
+            _, dot, domain = domain.partition(".")
+            if not dot:
+                return ""
+
+    def lookup(self, query):
+        try:
+            return self.lookup_ip(query)
+        except ValueError:
+            return self.lookup_domain(query)
+
+    def annotate(self, lines, batch=ANNOTATE_BATCH):
+        # Appends a tab and the matches for the first IPv4 address on each
+        # line ("-" for none), a batch of lines at a time.
+        search = IPV4.search
+        while True:
+            chunk = [line.rstrip("\n") for _, line in zip(range(batch), lines)]
+            if not chunk:
+                return
+            found = [search(line) for line in chunk]
+            matches = self.lookup_ips(m.group() if m else "" for m in found)
+            for line, match in zip(chunk, matches):
+                yield f"{line}\t{match or '-'}\n"
+
+
+def _label(lists, group):
+    # Each list once; a feed in its smallest window only.
+    seen = {}
+    for list_id in group:
+        name, window = lists[list_id]
+        if name not in seen or (window and WINDOWS[window] < WINDOWS[seen[name]]):
+            seen[name] = window
+    return ",".join(
+        f"{name}:{window}" if window else name for name, window in sorted(seen.items())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Look up IPs and domains in the published lists")
+    parser.add_argument("--index", type=Path, default=INDEX_FILE)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="compile the lists into the index file")
+    query = commands.add_parser("query", help="print the matches for each IP or domain")
+    query.add_argument("queries", nargs="+")
+    annotate = commands.add_parser("annotate", help="tag the first IPv4 on each log line")
+    annotate.add_argument("log", nargs="?", help="default: stdin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        index = LookupIndex.build()
+        index.save(args.index)
+        print(f"{len(index.v4_bounds):,} IPv4 bounds, {len(index.v6_bounds):,} IPv6 bounds, "
+              f"{len(index.domains):,} domains, {len(index.labels):,} list sets -> {args.index}")
+        return
+
+    index = LookupIndex.load(args.index)
+    if args.command == "query":
+        for q in args.queries:
+            print(f"{q}\t{index.lookup(q) or '-'}")
+        return
+
+    with open(args.log, errors="replace") if args.log else sys.stdin as lines:
+        sys.stdout.writelines(index.annotate(lines))
+
+
+if __name__ == "__main__":
+    main()
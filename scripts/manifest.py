@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+from pathlib import Path
+
+# Content hashes of the files a run derives (window files, output lists),
+# persisted next to them. A file is only rewritten when its new content
+# hashes differently, and every stage records whether it did any work so
+# the run can report what actually ran.
+
+
+def digest(data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+        # stage -> [ran, skipped]
+        self.stages = {}
+
+    def get(self, key):
+        return self.entries.get(str(key))
+
+    def put(self, key, value):
+        self.entries[str(key)] = value
+
+    def write_text(self, path, text):
+        return self.write_bytes(path, text.encode("utf-8"))
+
+    def write_bytes(self, path, data):
+        # Returns True if the file was (re)written. The file on disk is hashed
+        # too, so one edited or damaged since the last run is put right.
+        path = Path(path)
+        new = digest(data)
+        if self.get(path) == new and path.exists() and file_digest(path) == new:
+            return False
+        path.write_bytes(data)
+        self.put(path, new)
+        return True
+
+    def stage(self, name, ran):
+        counts = self.stages.setdefault(name, [0, 0])
+        counts[0 if ran else 1] += 1
+
+    def report(self):
+        for name, (ran, skipped) in self.stages.items():
+            print(f"{name}: {ran} ran, {skipped} skipped")
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.entries, indent=2, sort_keys=True) + "\n")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import requests
+
+import aggregate_feeds
+import aggregate_ips
+import scoring
+import tweetfeed
+from fetching import CHUNK_SIZE, TIMEOUT
+from run_report import RunReport
+
+# The scheduled jobs in one process, run as a dependency graph:
+#
+#   tweetfeed -> feeds -> ips   Tweetfeed ingest, aggregate_feeds.py,
+#                               aggregate_ips.py
+#   domains                     filter.py, alongside the IP chain
+#
+# Hand-offs stay in memory instead of going through a commit and
+# raw.githubusercontent.com: the weekly Tweetfeed set is given to
+# aggregate_feeds.py as the TWEETFEED_FEED fetch, and the window indexes it
+# updates are preloaded for aggregate_ips.py's scoring. A stage starts once
+# the stages before it have finished, whether or not they succeeded; without
+# a hand-off it reads what is on disk, as the separate jobs do.
+#
+# aggregate_ips.py counts with IPS_WORKERS processes; the default of one
+# keeps it from forking while the domains stage's thread is running.
+
+TWEETFEED_FEED = "tweetfeed"
+IPS_WORKERS = 1
+REPORT = Path("output/pipeline_report.json")
+
+WORK_DIR = Path(".cache/pipeline")
+HAGEZI_URL = "https://cdn.jsdelivr.net/gh/hagezi/dns-blocklists@latest/domains/{}.txt"
+# local name -> upstream list
+HAGEZI_LISTS = {"tif": "tif", "nrd7": "nrd7", "dga30": "dga14"}
+TRANCO_URL = "https://tranco-list.eu/top-1m-incl-subdomains.csv.zip"
+TRANCO_CSV = "top-1m.csv"
+DOMAIN_OUTPUT = Path("combined-hagezi-minus-tranco.txt")
+
+
+def download(url, path):
+    print(f"Fetching {url}")
+    with requests.get(url, timeout=TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+    return path
+
+
+def run_tweetfeed(done):
+    return tweetfeed.ingest()
+
+
+def run_feeds(done):
+    fetched = {}
+    if "tweetfeed" in done:
+        fetched[TWEETFEED_FEED] = done["tweetfeed"]["week"]
+    return aggregate_feeds.main(fetched)
+
+
+def run_ips(done):
+    if "feeds" in done:
+        scoring.preload(done["feeds"])
+    aggregate_ips.main(workers=IPS_WORKERS)
+
+
+def run_domains(done):
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import filter as filter_script
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+    lists = [
+        download(HAGEZI_URL.format(upstream), WORK_DIR / f"{name}.txt")
+        for name, upstream in HAGEZI_LISTS.items()
+    ]
+    with zipfile.ZipFile(download(TRANCO_URL, WORK_DIR / "tranco.zip")) as archive:
+        archive.extract(TRANCO_CSV, WORK_DIR)
+    # Plain subtraction, no --cache: the CSV is new every run (domain_index.py).
+    filter_script.main([*map(str, lists), str(WORK_DIR / TRANCO_CSV), str(DOMAIN_OUTPUT)])
+
+
+# name -> (stages it runs after, function of the finished stages' results)
+STAGES = {
+    "tweetfeed": ((), run_tweetfeed),
+    "feeds": (("tweetfeed",), run_feeds),
+    "ips": (("feeds",), run_ips),
+    "domains": ((), run_domains),
+}
+
+
+def run_stage(name, fn, done):
+    start = time.perf_counter()
+    try:
+        return fn(done), None, time.perf_counter() - start
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def run(selected, report):
+    # Returns the names of the stages that failed.
+    done, failed = {}, []
+    finished = set()
+    waiting = [name for name in STAGES if name in selected]
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(STAGES)) as executor:
+        while waiting or running:
+            for name in list(waiting):
+                after, fn = STAGES[name]
+                if all(dep in finished or dep not in selected for dep in after):
+                    waiting.remove(name)
+                    print(f"== {name}")
+                    running[executor.submit(run_stage, name, fn, dict(done))] = name
+            ready, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in ready:
+                name = running.pop(future)
+                result, error, seconds = future.result()
+                finished.add(name)
+                if error is None:
+                    done[name] = result
+                else:
+                    failed.append(name)
+                    print(f"== {name} failed: {error}")
+                report.source(name, seconds=round(seconds, 3), error=error)
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the list pipelines as one dependency graph")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    args = parser.parse_args()
+
+    report = RunReport("pipeline")
+    failed = run(set(args.stages), report)
+    report.stage("pipeline", stages=len(args.stages), failed=len(failed))
+    report.put("failed", failed)
+    report.print()
+    report.write(REPORT)
+    if failed:
+        sys.exit(f"Failed stage(s): {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+# Which sources, in which windows, reported each indicator.
+#
+# Every counted line carries a 16-bit tag: the source's index in the layout
+# and a bitmask of the windows it was listed in (a single bit for plain URL
+# sources). Grouping the tags by address gives a bitset per indicator with
+# one column per (source, window), held as an (indicators x words) uint64
+# matrix. A source's columns never straddle two words.
+#
+# Consensus scores are computed from that matrix: a group of correlated
+# sources (the ipsum levels are derived from each other, for instance)
+# casts one vote, worth the largest weight among its members that listed
+# the indicator. Unweighted, the score is a popcount over one bit per group.
+
+WINDOW_BITS = 8
+
+
+class Layout:
+    def __init__(self, sources, groups=()):
+        # sources: (name, window labels or None, weight) in source order.
+        # groups: lists of source names that vote together.
+        if len(sources) > 255:
+            raise ValueError("a layout holds at most 255 sources")
+        self.names = [name for name, _, _ in sources]
+        self.windows = [tuple(windows or ()) for _, windows, _ in sources]
+        self.weights = [weight for _, _, weight in sources]
+
+        # First bit column of each source.
+        self.columns = []
+        bit = 0
+        for windows in self.windows:
+            width = max(len(windows), 1)
+            if width > WINDOW_BITS:
+                raise ValueError(f"at most {WINDOW_BITS} windows per source")
+            if bit // 64 != (bit + width - 1) // 64:
+                bit = (bit // 64 + 1) * 64
+            self.columns.append(bit)
+            bit += width
+        self.words = max((bit + 63) // 64, 1)
+
+        group_of = {}
+        for members in groups:
+            for name in members:
+                group_of[name] = members[0]
+        self.groups = {}
+        for i, name in enumerate(self.names):
+            self.groups.setdefault(group_of.get(name, name), []).append(i)
+        if len(self.groups) > 64:
+            raise ValueError("a layout holds at most 64 source groups")
+
+    def window_mask(self, source, window=None):
+        # Columns of `source` that count for `window`: the windows no longer
+        # than it (they are nested), or every column when window is None.
+        windows = self.windows[source]
+        if not windows:
+            return 1
+        if window is None:
+            return (1 << len(windows)) - 1
+        keep = [i for i, label in enumerate(windows) if _days(label) <= _days(window)]
+        return sum(1 << i for i in keep)
+
+
+def tag(source, mask=1):
+    # source: index in the layout; mask: bit i for its i-th window.
+    return (source << WINDOW_BITS) | mask
+
+
+def _days(label):
+    return int(label.rstrip("d"))
+
+
+def bitsets(tags, starts, layout):
+    # tags grouped by indicator (`starts` as from ipcount._group_starts) ->
+    # (indicators x words) uint64 matrix.
+    tags = np.asarray(tags, dtype=np.uint16)
+    source = (tags >> WINDOW_BITS).astype(np.intp)
+    masks = (tags & ((1 << WINDOW_BITS) - 1)).astype(np.uint64)
+    columns = np.asarray(layout.columns, dtype=np.uint64)[source]
+    words = columns // np.uint64(64)
+    shifted = masks << (columns % np.uint64(64))
+
+    matrix = np.zeros((len(starts), layout.words), dtype=np.uint64)
+    for word in range(layout.words):
+        values = np.where(words == word, shifted, np.uint64(0))
+        if len(starts):
+            matrix[:, word] = np.bitwise_or.reduceat(values, starts)
+    return matrix
+
+
+def popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    as_bytes = values.view(np.uint8).reshape(*values.shape, values.itemsize)
+    return _BYTE_COUNTS[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+_BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class Consensus:
+    # Scores each indicator from its bitset; callable as the `consensus`
+    # argument of ipcount.Rollup.
+    def __init__(self, layout, window=None, weighted=True):
+        self.layout = layout
+        # (word, column mask) per source, restricted to `window`
+        self.masks = [
+            (column // 64, np.uint64(layout.window_mask(i, window) << (column % 64)))
+            for i, column in enumerate(layout.columns)
+        ]
+        self.weighted = weighted and any(w != 1 for w in layout.weights)
+
+    def __call__(self, tags, starts):
+        return self.scores(bitsets(tags, starts, self.layout))
+
+    def listed(self, matrix, source):
+        word, mask = self.masks[source]
+        return (matrix[:, word] & mask) != 0
+
+    def scores(self, matrix):
+        layout = self.layout
+        if not self.weighted:
+            votes = np.zeros(len(matrix), dtype=np.uint64)
+            for bit, members in enumerate(layout.groups.values()):
+                present = np.zeros(len(matrix), dtype=bool)
+                for source in members:
+                    present |= self.listed(matrix, source)
+                votes |= present.astype(np.uint64) << np.uint64(bit)
+            return popcount(votes).astype(np.float64)
+
+        scores = np.zeros(len(matrix), dtype=np.float64)
+        for members in layout.groups.values():
+            best = np.zeros(len(matrix), dtype=np.float64)
+            for source in members:
+                weight = layout.weights[source]
+                best = np.where(self.listed(matrix, source), np.maximum(best, weight), best)
+            scores += best
+        return scores
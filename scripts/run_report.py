@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Machine-readable run report shared by the scripts.
+#
+# stage() closes the stage that began where the previous one ended. It
+# records wall time, CPU time (this process plus finished worker processes),
+# peak RSS, and any sizes the caller passes (set and counter lengths).
+# source() records metrics for one input; later calls for the same name add
+# to its entry, so fetch and count figures end up side by side.
+#
+# Setting RUN_PROFILE to "cprofile" or "tracemalloc" makes profile() record
+# the hottest functions or the largest allocation sites of the wrapped block
+# into the report. Otherwise profile() costs nothing.
+
+PROFILE_ENV = "RUN_PROFILE"
+PROFILE_TOP = 25
+
+
+def _cpu_seconds():
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _peak_rss_mb(who=resource.RUSAGE_SELF):
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class RunReport:
+    def __init__(self, script):
+        self.script = script
+        self.started = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.stages = []
+        # name -> metrics; a source may be recorded in several steps
+        self.sources = {}
+        self.profiles = {}
+        self.extra = {}
+        self.profiler = os.environ.get(PROFILE_ENV)
+        self._mark()
+
+    def _mark(self):
+        self.wall = time.perf_counter()
+        self.cpu = _cpu_seconds()
+
+    def stage(self, name, **sizes):
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        self.stages.append({
+            "stage": name,
+            "seconds": round(wall - self.wall, 4),
+            "cpu_seconds": round(cpu - self.cpu, 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "peak_rss_children_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+            **sizes,
+        })
+        self._mark()
+
+    def source(self, name, **metrics):
+        self.sources.setdefault(name, {}).update(metrics)
+
+    def fetched(self, result, **metrics):
+        # A fetching.FetchResult.
+        self.source(
+            result.name,
+            url=result.url,
+            status=result.status,
+            bytes=result.bytes,
+            seconds=round(result.elapsed, 3),
+            attempts=result.attempts,
+            not_modified=result.not_modified,
+            unchanged=result.unchanged,
+            error=result.error,
+            **metrics,
+        )
+
+    def put(self, key, value):
+        self.extra[key] = value
+
+    @contextmanager
+    def profile(self, name):
+        if self.profiler == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                out = io.StringIO()
+                pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+                self.profiles[name] = out.getvalue().splitlines()
+        elif self.profiler == "tracemalloc":
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                top = snapshot.statistics("lineno")[:PROFILE_TOP]
+                self.profiles[name] = {
+                    "peak_mb": round(peak / 2**20, 1),
+                    "top": [str(stat) for stat in top],
+                }
+        elif self.profiler:
+            raise ValueError(f"unknown {PROFILE_ENV} {self.profiler!r}")
+        else:
+            yield
+
+    def as_dict(self):
+        return {
+            "script": self.script,
+            "started": self.started,
+            "seconds": round(sum(s["seconds"] for s in self.stages), 4),
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "stages": self.stages,
+            "sources": [{"source": name, **m} for name, m in self.sources.items()],
+            **({"profiles": self.profiles} if self.profiles else {}),
+            **self.extra,
+        }
+
+    def print(self):
+        for s in self.stages:
+            sizes = ", ".join(
+                f"{k} {v:,}" for k, v in s.items()
+                if k not in ("stage", "seconds", "cpu_seconds", "peak_rss_mb",
+                             "peak_rss_children_mb") and isinstance(v, int)
+            )
+            print(f"{s['stage']:<20} {s['seconds']:8.2f}s  cpu {s['cpu_seconds']:8.2f}s  "
+                  f"peak RSS {s['peak_rss_mb']:8.1f} MB  {sizes}")
+
+    def write(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.as_dict(), indent=2) + "\n")
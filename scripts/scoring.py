@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+from itertools import compress
+
+import numpy as np
+
+from aggregate_feeds import BASE_DIR, MAX_RAW_DAYS, WINDOWS, build_index
+from snapshot_store import SnapshotStore
+from window_index import INDEX_NAME, LAST, WindowIndex, load_last_seen
+
+# Recency scores for the feeds aggregate_feeds.py keeps under aggregated/.
+#
+# Each indicator's last-seen day comes from the feed's window index, or from
+# a replay of raw/ when the index is missing or stale. Its age is counted
+# from the feed's newest snapshot, which is the day the window files were
+# last written. A score function maps that age in days to a weight:
+#
+#   step(windows)      one point per window the indicator falls in. Listing
+#                      a feed's 90d/30d/7d/1d files as four separate sources
+#                      gave exactly these 1/2/3/4 counts.
+#   decay(half_life)   halves every half_life days
+#
+# Ages beyond MAX_RAW_DAYS score nothing, as there is no snapshot left.
+#
+# Window indexes already in memory (pipeline.py hands over the ones
+# aggregate_feeds.py just updated) are registered with preload() and used
+# before anything on disk.
+
+PRELOADED = {}
+
+
+def preload(indexes):
+    # indexes: {feed name: WindowIndex}
+    PRELOADED.update(indexes)
+
+
+def step(windows=tuple(WINDOWS)):
+    spans = [WINDOWS[label] for label in windows]
+
+    def score(age):
+        return sum(1 for span in spans if age < span)
+    return score
+
+
+def decay(half_life):
+    def score(age):
+        return 0.5 ** (age / half_life)
+    return score
+
+
+def last_seen(feed):
+    # (sorted indicators, last-seen day ordinals, newest snapshot day), or
+    # None for a feed without raw/. A preloaded or cached index is used when
+    # it was built from exactly the snapshots on disk.
+    feed_dir = BASE_DIR / feed
+    raw_dir = feed_dir / "raw"
+    if not raw_dir.is_dir():
+        return None
+
+    store = SnapshotStore(raw_dir)
+    days = store.days()
+    if not days:
+        return None
+
+    index = PRELOADED.get(feed)
+    if index is None or not index.matches(days, days[-1]):
+        cached = load_last_seen(feed_dir / INDEX_NAME)
+        if cached is not None and WindowIndex(cached[0]).matches(days, days[-1]):
+            return cached[1], cached[2], days[-1]
+        index = build_index(store)
+    indicators = sorted(index.entries)
+    return indicators, [index.entries[i][LAST] for i in indicators], days[-1]
+
+
+def feed_scores(feed, score):
+    # Indicators in window-file order (sorted) with their nonzero scores.
+    seen = last_seen(feed)
+    if seen is None:
+        print(f"No raw snapshots for {feed}")
+        return [], []
+
+    indicators, last, newest = seen
+    table = np.array([score(age) for age in range(MAX_RAW_DAYS)] + [0])
+    ages = np.minimum(newest.toordinal() - np.array(last, dtype=np.int64), MAX_RAW_DAYS)
+    weights = table[ages]
+    keep = weights != 0
+    return list(compress(indicators, keep.tolist())), weights[keep].tolist()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+import argparse
+import ipaddress
+import mmap
+import socket
+import struct
+from pathlib import Path
+
+import numpy as np
+
+# Compact binary format for feed snapshots (raw/YYYY-MM-DD.ips).
+#
+# A snapshot is a set of indicator strings. Anything whose text can be
+# rebuilt exactly is stored as integers, so exporting to text is always
+# byte-identical to the sorted text snapshot it replaces:
+#
+#   header   magic, version, encoding, then entry counts and byte sizes
+#   v4       sorted IPv4 host addresses
+#   cidr4    sorted (address, prefix) pairs for "a.b.c.d/n" entries
+#   v6       sorted IPv6 addresses written in compressed or exploded form,
+#            followed by one form byte per address
+#   other    every other line as length-prefixed UTF-8
+#
+# With ENCODING_RAW the v4 section is a little-endian uint32 array that a
+# reader maps without copying. ENCODING_VARINT stores sorted deltas as
+# LEB128 varints, which is what makes snapshots small on disk.
+
+MAGIC = b"IPSN"
+VERSION = 1
+SUFFIX = ".ips"
+
+ENCODING_RAW = 0
+ENCODING_VARINT = 1
+ENCODINGS = {"raw": ENCODING_RAW, "varint": ENCODING_VARINT}
+
+HEADER = struct.Struct("<4sBBH4I4I")
+
+V6_COMPRESSED = 0
+V6_EXPLODED = 1
+
+
+def classify(indicators):
+    v4, cidr4, v6, other = [], [], [], []
+    pton = socket.inet_pton
+    af_inet = socket.AF_INET
+
+    for indicator in indicators:
+        try:
+            v4.append(int.from_bytes(pton(af_inet, indicator), "big"))
+            continue
+        except (OSError, ValueError):
+            pass
+
+        if "/" in indicator:
+            addr, _, prefix = indicator.partition("/")
+            try:
+                packed = pton(af_inet, addr)
+            except (OSError, ValueError):
+                packed = None
+            if packed and prefix.isdigit() and str(int(prefix)) == prefix and int(prefix) <= 32:
+                cidr4.append((int.from_bytes(packed, "big"), int(prefix)))
+                continue
+        elif ":" in indicator:
+            try:
+                ip = ipaddress.IPv6Address(indicator)
+            except ValueError:
+                ip = None
+            if ip is not None and str(ip) == indicator:
+                v6.append((int(ip), V6_COMPRESSED))
+                continue
+            if ip is not None and ip.exploded == indicator:
+                v6.append((int(ip), V6_EXPLODED))
+                continue
+
+        other.append(indicator)
+
+    return sorted(v4), sorted(cidr4), sorted(v6), sorted(other)
+
+
+def pack(indicators, encoding=ENCODING_VARINT):
+    v4, cidr4, v6, other = classify(indicators)
+
+    v4 = np.array(v4, dtype=np.uint64)
+    if encoding == ENCODING_RAW:
+        v4_bytes = v4.astype("<u4").tobytes()
+    else:
+        v4_bytes = varint_encode(np.diff(v4, prepend=np.uint64(0)))
+
+    nets = np.array([net for net, _ in cidr4], dtype=np.uint64)
+    cidr4_bytes = (
+        varint_encode(np.diff(nets, prepend=np.uint64(0)))
+        + bytes(prefix for _, prefix in cidr4)
+    )
+
+    v6_bytes = bytearray()
+    previous = 0
+    for ip, _ in v6:
+        if encoding == ENCODING_RAW:
+            v6_bytes += ip.to_bytes(16, "big")
+        else:
+            v6_bytes += _varint(ip - previous)
+            previous = ip
+    v6_bytes += bytes(form for _, form in v6)
+
+    other_bytes = bytearray()
+    for indicator in other:
+        data = indicator.encode("utf-8")
+        other_bytes += _varint(len(data)) + data
+
+    header = HEADER.pack(
+        MAGIC, VERSION, encoding, 0,
+        len(v4), len(cidr4), len(v6), len(other),
+        len(v4_bytes), len(cidr4_bytes), len(v6_bytes), len(other_bytes),
+    )
+    return b"".join([header, v4_bytes, cidr4_bytes, bytes(v6_bytes), bytes(other_bytes)])
+
+
+def write_snapshot(path, indicators, encoding=ENCODING_VARINT):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(pack(indicators, encoding))
+    tmp.replace(path)
+
+
+class Snapshot:
+    # Memory-mapped reader. Sections are decoded on demand; with the raw
+    # encoding v4() is a view straight into the mapping. A snapshot may be
+    # embedded in a larger file at `offset`; `end` is where it stops.
+    def __init__(self, path, offset=0):
+        with open(path, "rb") as f:
+            size = f.seek(0, 2)
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        if len(self.buf) < offset + HEADER.size:
+            raise ValueError(f"{path}: truncated snapshot")
+        (magic, version, self.encoding, _, *rest) = HEADER.unpack_from(self.buf, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a v{VERSION} snapshot")
+
+        self.n_v4, self.n_cidr4, self.n_v6, self.n_other = rest[:4]
+        offset += HEADER.size
+        self.sections = []
+        for size in rest[4:]:
+            self.sections.append((offset, size))
+            offset += size
+        self.end = offset
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def __len__(self):
+        return self.n_v4 + self.n_cidr4 + self.n_v6 + self.n_other
+
+    def _section(self, i):
+        offset, size = self.sections[i]
+        return np.frombuffer(self.buf, dtype=np.uint8, count=size, offset=offset)
+
+    def v4(self):
+        offset, _ = self.sections[0]
+        if self.encoding == ENCODING_RAW:
+            return np.frombuffer(self.buf, dtype="<u4", count=self.n_v4, offset=offset)
+        return np.cumsum(varint_decode(self._section(0), self.n_v4)).astype(np.uint32)
+
+    def cidr4(self):
+        data = self._section(1)
+        prefixes = data[len(data) - self.n_cidr4:]
+        nets = np.cumsum(varint_decode(data[:len(data) - self.n_cidr4], self.n_cidr4))
+        return nets.astype(np.uint32), prefixes
+
+    def v6(self):
+        # [(address, form)]
+        data = bytes(self._section(2))
+        forms = data[len(data) - self.n_v6:]
+        if self.encoding == ENCODING_RAW:
+            ips = [int.from_bytes(data[i:i + 16], "big") for i in range(0, 16 * self.n_v6, 16)]
+        else:
+            ips, previous, pos = [], 0, 0
+            for _ in range(self.n_v6):
+                delta, pos = _read_varint(data, pos)
+                previous += delta
+                ips.append(previous)
+        return list(zip(ips, forms))
+
+    def other(self):
+        data = bytes(self._section(3))
+        out, pos = [], 0
+        for _ in range(self.n_other):
+            length, pos = _read_varint(data, pos)
+            out.append(data[pos:pos + length].decode("utf-8"))
+            pos += length
+        return out
+
+    def indicators(self):
+        out = format_v4(self.v4())
+        nets, prefixes = self.cidr4()
+        out += [f"{net}/{prefix}" for net, prefix in zip(format_v4(nets), prefixes.tolist())]
+        for ip, form in self.v6():
+            ip = ipaddress.IPv6Address(ip)
+            out.append(ip.exploded if form == V6_EXPLODED else str(ip))
+        out += self.other()
+        return out
+
+
+def read_snapshot(path, offset=0):
+    with Snapshot(path, offset) as snapshot:
+        return set(snapshot.indicators())
+
+
+def export_text(path, out_path):
+    out_path.write_text("\n".join(sorted(read_snapshot(path))) + "\n")
+
+
+def varint_encode(values):
+    # Vectorized LEB128 over a uint64 array.
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= np.uint64(1 << (7 * k))
+    owner = np.repeat(np.arange(len(values)), lengths)
+    starts = np.cumsum(lengths) - lengths
+    pos = np.arange(lengths.sum()) - starts[owner]
+    out = (values[owner] >> (np.uint64(7) * pos.astype(np.uint64))) & np.uint64(0x7F)
+    out |= np.where(pos < lengths[owner] - 1, np.uint64(0x80), np.uint64(0))
+    return out.astype(np.uint8).tobytes()
+
+
+def varint_decode(data, count):
+    data = np.asarray(data, dtype=np.uint8)
+    if not count:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)[:count]
+    starts = np.r_[0, ends[:-1] + 1]
+    lengths = ends - starts + 1
+    pos = np.arange(ends[-1] + 1) - np.repeat(starts, lengths)
+    parts = (data[:ends[-1] + 1] & 0x7F).astype(np.uint64) << (np.uint64(7) * pos.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+_OCTETS = np.array([str(i).encode() for i in range(256)], dtype="S3")
+
+
+def format_v4(ips):
+    # Dotted quads for a uint32 array, built with vectorized string ops
+    # rather than one f-string per address.
+    ips = np.asarray(ips, dtype=np.uint32)
+    if not len(ips):
+        return []
+    octets = [_OCTETS[(ips >> np.uint32(shift)) & np.uint32(255)] for shift in (24, 16, 8, 0)]
+    out = octets[0]
+    for octet in octets[1:]:
+        out = np.char.add(np.char.add(out, b"."), octet)
+    out = np.char.add(out, b"\n")
+    return out.tobytes().replace(b"\0", b"").decode("ascii").split("\n")[:-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert feed snapshots to and from the packed format")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pack_cmd = sub.add_parser("pack", help="convert text snapshots to .ips")
+    pack_cmd.add_argument("files", nargs="+", type=Path)
+    pack_cmd.add_argument("--encoding", choices=ENCODINGS, default="varint")
+    pack_cmd.add_argument("--keep", action="store_true", help="keep the text files")
+
+    export_cmd = sub.add_parser("export", help="write .ips snapshots back out as sorted text")
+    export_cmd.add_argument("files", nargs="+", type=Path)
+
+    args = parser.parse_args()
+
+    for path in args.files:
+        if args.command == "pack":
+            indicators = {line.strip() for line in path.read_text().splitlines() if line.strip()}
+            out_path = path.with_suffix(SUFFIX)
+            write_snapshot(out_path, indicators, ENCODINGS[args.encoding])
+            print(f"{path}: {path.stat().st_size:,} -> {out_path.stat().st_size:,} bytes")
+            if not args.keep:
+                path.unlink()
+        else:
+            out_path = path.with_suffix(".txt")
+            export_text(path, out_path)
+            print(f"{path} -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import shutil
+import struct
+from datetime import datetime
+
+from snapshot_format import SUFFIX as PACKED_SUFFIX, Snapshot, pack, read_snapshot, write_snapshot
+
+# raw/ snapshot storage for one feed. Every stored day is a single file:
+#
+#   YYYY-MM-DD.txt    full snapshot as sorted text (the original layout)
+#   YYYY-MM-DD.ips    full snapshot in the packed format
+#   YYYY-MM-DD.delta  journal entry: adds and removes against the
+#                     previous stored day
+#
+# Full snapshots double as journal checkpoints. Any mix of the three can be
+# read, and a day is rebuilt by replaying deltas from the nearest full
+# snapshot at or before it. In journal mode a new full snapshot is written
+# every CHECKPOINT_DAYS, so a replay never reads more than that many files.
+
+TEXT_SUFFIX = ".txt"
+DELTA_SUFFIX = ".delta"
+FULL_SUFFIXES = (TEXT_SUFFIX, PACKED_SUFFIX)
+SUFFIXES = FULL_SUFFIXES + (DELTA_SUFFIX,)
+
+FORMATS = ("text", "packed", "journal")
+CHECKPOINT_DAYS = 7
+
+# A delta file is this header followed by two packed snapshots: adds, removes.
+DELTA_MAGIC = b"IPSD"
+DELTA_VERSION = 1
+DELTA_HEADER = struct.Struct("<4sB")
+
+
+def load_ips_from_file(path):
+    return {
+        line.strip()
+        for line in path.read_text().splitlines()
+        if line.strip()
+    }
+
+
+def raw_day(raw_file):
+    return datetime.strptime(raw_file.stem, "%Y-%m-%d").date()
+
+
+def write_delta(path, adds, removes):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(DELTA_HEADER.pack(DELTA_MAGIC, DELTA_VERSION) + pack(adds) + pack(removes))
+    tmp.replace(path)
+
+
+def read_delta(path):
+    with open(path, "rb") as f:
+        magic, version = DELTA_HEADER.unpack(f.read(DELTA_HEADER.size))
+    if magic != DELTA_MAGIC or version != DELTA_VERSION:
+        raise ValueError(f"{path}: not a v{DELTA_VERSION} delta")
+
+    with Snapshot(path, DELTA_HEADER.size) as adds:
+        removes_at = adds.end
+        added = set(adds.indicators())
+    return added, read_snapshot(path, removes_at)
+
+
+class SnapshotStore:
+    def __init__(self, raw_dir, fmt="packed", checkpoint_days=CHECKPOINT_DAYS):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown snapshot format {fmt!r}")
+        self.raw_dir = raw_dir
+        self.fmt = fmt
+        self.checkpoint_days = checkpoint_days
+
+    def files(self):
+        return sorted(p for p in self.raw_dir.iterdir() if p.suffix in SUFFIXES)
+
+    def days(self):
+        return [raw_day(p) for p in self.files()]
+
+    def path_for(self, day):
+        for suffix in SUFFIXES:
+            path = self.raw_dir / f"{day}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def read(self, day):
+        files = self.files()
+        days = [raw_day(p) for p in files]
+        if day not in days:
+            raise FileNotFoundError(f"no snapshot for {day} in {self.raw_dir}")
+
+        end = days.index(day)
+        start = end
+        while files[start].suffix == DELTA_SUFFIX:
+            if start == 0:
+                raise ValueError(f"{files[end]}: no full snapshot to replay from")
+            start -= 1
+
+        current = None
+        for path in files[start:end + 1]:
+            current = self._apply(current, path)
+        return current
+
+    def replay(self):
+        # Every stored day in order, each rebuilt from the one before it.
+        current = None
+        for path in self.files():
+            if current is None and path.suffix == DELTA_SUFFIX:
+                raise ValueError(f"{path}: no full snapshot to replay from")
+            current = self._apply(current, path)
+            yield raw_day(path), current
+
+    def _apply(self, current, path):
+        if path.suffix == TEXT_SUFFIX:
+            return load_ips_from_file(path)
+        if path.suffix == PACKED_SUFFIX:
+            return read_snapshot(path)
+        adds, removes = read_delta(path)
+        return (current - removes) | adds
+
+    def write(self, day, indicators):
+        # Re-running a day replaces whatever was stored for it.
+        for suffix in SUFFIXES:
+            (self.raw_dir / f"{day}{suffix}").unlink(missing_ok=True)
+
+        if self.fmt == "text":
+            path = self.raw_dir / f"{day}{TEXT_SUFFIX}"
+            path.write_text("\n".join(sorted(indicators)) + "\n")
+            return
+        if self.fmt == "packed" or self._needs_checkpoint(day):
+            write_snapshot(self.raw_dir / f"{day}{PACKED_SUFFIX}", indicators)
+            return
+
+        previous = self.read(self.days()[-1])
+        write_delta(
+            self.raw_dir / f"{day}{DELTA_SUFFIX}",
+            indicators - previous,
+            previous - indicators,
+        )
+
+    def repeat(self, day):
+        # Store `day` as a copy of the newest stored day without reading it
+        # back: an empty delta in journal mode, otherwise a copy of the file.
+        files = self.files()
+        newest = files[-1]
+        if raw_day(newest) >= day:
+            raise ValueError(f"cannot repeat {newest} as {day}")
+
+        if self.fmt == "journal" and not self._needs_checkpoint(day):
+            write_delta(self.raw_dir / f"{day}{DELTA_SUFFIX}", set(), set())
+        elif newest.suffix == (TEXT_SUFFIX if self.fmt == "text" else PACKED_SUFFIX):
+            shutil.copyfile(newest, self.raw_dir / f"{day}{newest.suffix}")
+        else:
+            self.write(day, self.read(raw_day(newest)))
+
+    def _needs_checkpoint(self, day):
+        files = self.files()
+        if not files:
+            return True
+        if raw_day(files[-1]) > day:
+            raise ValueError(f"cannot journal {day} before the newer snapshot {files[-1]}")
+
+        full = [raw_day(p) for p in files if p.suffix in FULL_SUFFIXES]
+        return not full or (day - full[-1]).days >= self.checkpoint_days
+
+    def prune(self, keep):
+        # Keep at least `keep` days. Deltas depend on the days before them,
+        # so old days can only go once the first remaining day is a full
+        # snapshot; with plain full snapshots this keeps exactly `keep`.
+        files = self.files()
+        cut = len(files) - keep
+        while cut > 0 and files[cut].suffix == DELTA_SUFFIX:
+            cut -= 1
+        if cut <= 0:
+            return []
+
+        for old_file in files[:cut]:
+            print(f"Removing old raw snapshot: {old_file}")
+            old_file.unlink()
+        return [raw_day(p) for p in files[:cut]]
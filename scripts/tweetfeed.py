@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import codecs
+import json
+from pathlib import Path
+
+import requests
+
+from fetching import CHUNK_SIZE, TIMEOUT
+
+# Tweetfeed IP IOCs, written to iocs/tweetfeed_<period>ly_ips.txt as sorted,
+# de-duplicated values (what `curl | jq -r '.[].value' | sort -u` produced).
+#
+# The API returns one JSON array per period. It is decoded as it streams in,
+# one element at a time, so only the current element and the set of values
+# are held, never the whole response.
+
+API_URL = "https://api.tweetfeed.live/v1/{period}/ip"
+PERIODS = ["week", "month", "year"]
+IOC_DIR = Path("iocs")
+
+
+def ioc_file(period):
+    return IOC_DIR / f"tweetfeed_{period}ly_ips.txt"
+
+
+def iter_json_array(chunks):
+    # Elements of a top-level JSON array, from an iterable of byte chunks.
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    pos = 0
+    for chunk in chunks:
+        buffer = buffer[pos:] + text.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            if end == len(buffer):
+                break  # a number may go on in the next chunk
+            yield value
+            pos = end
+    raise ValueError("truncated JSON array")
+
+
+def fetch_values(url, session=requests):
+    with session.get(url, timeout=TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        return {
+            item["value"]
+            for item in iter_json_array(response.iter_content(CHUNK_SIZE))
+            if isinstance(item, dict) and isinstance(item.get("value"), str)
+        }
+
+
+def write_values(path, values):
+    # Returns True if the file changed.
+    text = "".join(f"{value}\n" for value in sorted(values))
+    if path.exists() and path.read_text() == text:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return True
+
+
+def ingest(periods=PERIODS):
+    # {period: set of values}; every period's file is rewritten if it changed.
+    values = {}
+    with requests.Session() as session:
+        for period in periods:
+            print(f"Fetching {period} feed...")
+            values[period] = fetch_values(API_URL.format(period=period), session)
+            changed = write_values(ioc_file(period), values[period])
+            print(f"{ioc_file(period)}: {len(values[period])} values"
+                  f"{'' if changed else ', unchanged'}")
+    return values
+
+
+def main():
+    ingest()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+from datetime import date
+from pathlib import Path
+
+# Per-feed rolling-window index. For every indicator we keep the ordinal of the
+# first day it was seen, the last day it was seen, and the day it was seen
+# before that. A window of N days is then simply "last seen within N days",
+# so the window files can be rebuilt from the index plus today's snapshot
+# instead of re-reading every raw snapshot once per window.
+
+INDEX_NAME = "index.tsv"
+
+FIRST, PREV, LAST = range(3)
+
+
+class WindowIndex:
+    def __init__(self, days=None, entries=None):
+        # Ordinals of the raw snapshot days folded into the index.
+        self.days = set(days or ())
+        # indicator -> [first_seen, prev_seen, last_seen] (0 = never)
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return None
+
+        entries = {}
+        with path.open() as f:
+            header = f.readline().split()
+            if header[:2] != ["#", "days"]:
+                return None
+            days = {int(d) for d in header[2:]}
+            for line in f:
+                indicator, first, prev, last = line.rstrip("\n").split("\t")
+                entries[indicator] = [int(first), int(prev), int(last)]
+
+        return cls(days, entries)
+
+    def save(self, path):
+        path = Path(path)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("w") as f:
+            f.write("# days " + " ".join(str(d) for d in sorted(self.days)) + "\n")
+            for indicator in sorted(self.entries):
+                first, prev, last = self.entries[indicator]
+                f.write(f"{indicator}\t{first}\t{prev}\t{last}\n")
+        tmp.replace(path)
+
+    def matches(self, raw_days, today):
+        # The index is only trusted if it was built from exactly the raw
+        # snapshots on disk; today's snapshot may or may not be folded in yet.
+        today = today.toordinal()
+        raw = {d.toordinal() for d in raw_days}
+        return (
+            all(d <= today for d in self.days)
+            and self.days | {today} == raw | {today}
+        )
+
+    def add_snapshot(self, day, indicators):
+        day = day.toordinal()
+        if day in self.days:
+            self._revert(day)
+        elif self.days and day < max(self.days):
+            raise ValueError(f"cannot fold {date.fromordinal(day)} into a newer index")
+
+        for indicator in indicators:
+            entry = self.entries.get(indicator)
+            if entry is None:
+                self.entries[indicator] = [day, 0, day]
+            elif entry[LAST] != day:
+                entry[PREV] = entry[LAST]
+                entry[LAST] = day
+
+        self.days.add(day)
+
+    def repeat_newest(self, day):
+        # Fold in a snapshot identical to the newest one without needing its
+        # contents: exactly the indicators last seen that day were seen again.
+        day = day.toordinal()
+        newest = max(self.days)
+        if day <= newest:
+            raise ValueError(f"cannot repeat {date.fromordinal(newest)} as {date.fromordinal(day)}")
+
+        for entry in self.entries.values():
+            if entry[LAST] == newest:
+                entry[PREV] = newest
+                entry[LAST] = day
+
+        self.days.add(day)
+
+    def _revert(self, day):
+        # Undo a previous fold of the newest day so it can be re-fetched.
+        if day != max(self.days):
+            raise ValueError(f"can only revert the newest day, not {date.fromordinal(day)}")
+
+        for indicator, entry in list(self.entries.items()):
+            if entry[LAST] != day:
+                continue
+            if entry[PREV] == 0:
+                del self.entries[indicator]
+            else:
+                entry[LAST] = entry[PREV]
+
+        self.days.discard(day)
+
+    def expire(self, today, horizon):
+        # Drop indicators that can no longer appear in any window.
+        cutoff = today.toordinal() - (horizon - 1)
+        self.entries = {
+            indicator: entry
+            for indicator, entry in self.entries.items()
+            if entry[LAST] >= cutoff
+        }
+
+    def forget_days(self, days):
+        self.days -= {d.toordinal() for d in days}
+
+    def windows(self, today, windows):
+        # Build every window in a single sorted pass over the index.
+        today = today.toordinal()
+        cutoffs = {label: today - (days - 1) for label, days in windows.items()}
+        out = {label: [] for label in windows}
+
+        for indicator in sorted(self.entries):
+            last = self.entries[indicator][LAST]
+            for label, cutoff in cutoffs.items():
+                if last >= cutoff:
+                    out[label].append(indicator)
+
+        return out
+
+
+def load_last_seen(path):
+    # (days, indicators, last-seen ordinals) read straight from an index
+    # file, in its sorted order, without building the full entry table.
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    with path.open() as f:
+        header = f.readline().split()
+        if header[:2] != ["#", "days"]:
+            return None
+        fields = f.read().split()
+    days = {int(d) for d in header[2:]}
+    return days, fields[0::4], [int(last) for last in fields[3::4]]